@@ -0,0 +1,129 @@
+"""
+Post-game analysis of PGN archives over a pool of persistent Stockfish engines.
+
+Every position of a game is searched on the same engine, in move order, with
+the game history sent along: the engine is not reset between the moves of a
+game, so its hash table carries the search of move N over to move N + 1. Games
+are spread across the engines of the pool and each one gives one NDJSON record
+with its headers, the analysis of every ply and its time and nodes per second.
+
+    python analyse_games.py games.pgn --output games.ndjson --engines 4 --depth 18
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import chess
+import chess.engine
+import chess.pgn
+
+from analysis.engine import ENGINE_HASH, analysis_from_info
+from analysis.engine_pool import EnginePool
+
+GAME_HEADERS = ('Event', 'Date', 'White', 'Black', 'Result')
+
+
+def iter_games(path):
+    """Yield (game number, game) without loading the whole archive"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        game_number = 0
+        while True:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                return
+            game_number += 1
+            yield game_number, game
+
+def analyse_game(engine, game_number, game, limit):
+    """Analyse the position before every mainline move of game, keeping the engine state between moves"""
+    board = game.board()
+    game_key = object()
+    plies = []
+    nodes = 0
+    start_time = time.perf_counter()
+
+    for move in game.mainline_moves():
+        # Same game key: no ucinewgame, the hash table stays warm from the previous move
+        info = engine.analyse(board, limit, game=game_key)
+        ply = analysis_from_info(info)
+        ply['move'] = move.uci()
+        ply['nodes'] = info.get('nodes', 0)
+        plies.append(ply)
+        nodes += ply['nodes']
+        board.push(move)
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        'game': game_number,
+        'headers': {key: game.headers[key] for key in GAME_HEADERS if key in game.headers},
+        'plies': plies,
+        'time': elapsed,
+        'nodes': nodes,
+        'nps': int(nodes / elapsed) if elapsed > 0 else 0,
+    }
+
+def analyse_games(input_path, output_path, engines=1, depth=None, movetime=None, hash_size=ENGINE_HASH):
+    """Analyse every game of a PGN file, writing one NDJSON record per game to output_path"""
+    limit = chess.engine.Limit(depth=depth, time=movetime)
+    games = iter_games(input_path)
+    game_count = ply_count = nodes = 0
+    game_time = 0.0
+    start_time = time.perf_counter()
+
+    with EnginePool(engines, hash_size=hash_size) as pool, open(output_path, 'w', encoding='utf-8') as output:
+        print(f"♟️ {pool.size} moteur(s) x {pool.threads} thread(s)", file=sys.stderr)
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < 2 * pool.size:
+                try:
+                    game_number, game = next(games)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(analyse_game, game_number, game, limit)] = game_number
+
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                game_number = pending.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # A crashed engine or an illegal move in the PGN only fails this game, the others go on
+                    record = {'game': game_number, 'error': f"{type(e).__name__}: {e}"}
+                    print(f"   Partie {game_number}: échec, {record['error']}", file=sys.stderr)
+                else:
+                    game_count += 1
+                    ply_count += len(record['plies'])
+                    nodes += record['nodes']
+                    game_time += record['time']
+                    print(f"   Partie {game_number}: {len(record['plies'])} coups en {record['time']:.1f}s, "
+                          f"{record['nps']} nœuds/s", file=sys.stderr)
+                output.write(json.dumps(record) + '\n')
+            output.flush()
+
+    elapsed = time.perf_counter() - start_time
+    print(f"✅ {game_count} parties ({ply_count} coups) analysées en {elapsed:.1f}s", file=sys.stderr)
+    if game_count:
+        print(f"   {game_time / game_count:.1f}s par partie, {int(nodes / max(game_time, 1e-9))} nœuds/s par moteur",
+              file=sys.stderr)
+    return game_count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analyse les parties d'un fichier PGN avec un pool de moteurs Stockfish")
+    parser.add_argument('input', help="Fichier PGN")
+    parser.add_argument('--output', required=True, help="Fichier NDJSON de résultats, une partie par ligne")
+    parser.add_argument('--engines', type=int, default=1, help="Nombre de moteurs, les CPU étant partagés entre eux")
+    parser.add_argument('--depth', type=int, default=None, help="Profondeur de recherche par coup")
+    parser.add_argument('--movetime', type=float, default=None, help="Temps de recherche par coup en secondes")
+    parser.add_argument('--hash', type=int, default=ENGINE_HASH, help="Table de transposition par moteur en Mo")
+    args = parser.parse_args()
+
+    if args.depth is None and args.movetime is None:
+        parser.error("--depth ou --movetime est requis")
+    analyse_games(args.input, args.output, args.engines, args.depth, args.movetime, args.hash)
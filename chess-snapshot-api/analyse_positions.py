@@ -0,0 +1,135 @@
+"""
+Offline analysis of EPD/FEN files over a pool of persistent Stockfish engines.
+
+Each input line is a FEN or an EPD record (its 'id' operation is kept). Results
+are written as NDJSON as soon as each position is analysed, so they come out of
+input order; every record carries the input line number. With --resume, lines
+already present in the output file are skipped and new results are appended,
+so an interrupted run continues where it stopped.
+
+    python analyse_positions.py positions.epd --output results.ndjson --engines 4 --depth 20 --multipv 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import chess
+import chess.engine
+
+from analysis.engine import ENGINE_HASH, analysis_from_info
+from analysis.engine_pool import EnginePool
+
+
+def parse_position(line):
+    """Board and optional id of a FEN or EPD line"""
+    try:
+        return chess.Board(line), None
+    except ValueError:
+        board, operations = chess.Board.from_epd(line)
+        return board, operations.get('id')
+
+def iter_positions(path, done_lines):
+    """Yield (line number, text) for the non-empty lines not analysed yet"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if line and not line.startswith('#') and line_number not in done_lines:
+                yield line_number, line
+
+def read_done_lines(output_path):
+    """Line numbers already written to the output file"""
+    done_lines = set()
+    if not os.path.exists(output_path):
+        return done_lines
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for record in f:
+            try:
+                done_lines.add(json.loads(record)['line'])
+            except (ValueError, KeyError):
+                # Partial last line of an interrupted run
+                continue
+    return done_lines
+
+def analyse_line(engine, line_number, line, limit, multipv):
+    record = {'line': line_number}
+    try:
+        board, position_id = parse_position(line)
+    except ValueError as e:
+        return {**record, 'input': line, 'error': str(e)}
+
+    if position_id is not None:
+        record['id'] = position_id
+    record['fen'] = board.fen()
+
+    infos = engine.analyse(board, limit, multipv=multipv)
+    record.update(analysis_from_info(infos[0]))
+    if multipv > 1:
+        record['multipv'] = [analysis_from_info(info) for info in infos]
+    return record
+
+def analyse_positions(input_path, output_path, engines=1, depth=None, movetime=None, multipv=1,
+                      hash_size=ENGINE_HASH, resume=False):
+    """Analyse every position of input_path, appending one NDJSON record per position to output_path"""
+    limit = chess.engine.Limit(depth=depth, time=movetime)
+    done_lines = read_done_lines(output_path) if resume else set()
+    if done_lines:
+        print(f"↩️ Reprise: {len(done_lines)} positions déjà analysées", file=sys.stderr)
+
+    positions = iter_positions(input_path, done_lines)
+    count = 0
+    start_time = time.perf_counter()
+
+    with EnginePool(engines, hash_size=hash_size) as pool, \
+            open(output_path, 'a' if resume else 'w', encoding='utf-8') as output:
+        print(f"♟️ {pool.size} moteur(s) x {pool.threads} thread(s)", file=sys.stderr)
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            # Keep every engine busy without reading the whole input in memory
+            while not exhausted and len(pending) < 2 * pool.size:
+                try:
+                    line_number, line = next(positions)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(analyse_line, line_number, line, limit, multipv)] = line_number
+
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                line_number = pending.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # A crashed engine has been replaced, the other positions go on
+                    record = {'line': line_number, 'error': f"{type(e).__name__}: {e}"}
+                output.write(json.dumps(record) + '\n')
+                count += 1
+            output.flush()
+
+    elapsed = time.perf_counter() - start_time
+    print(f"✅ {count} positions analysées en {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} positions/s)",
+          file=sys.stderr)
+    return count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analyse un fichier EPD/FEN avec un pool de moteurs Stockfish")
+    parser.add_argument('input', help="Fichier EPD ou FEN, une position par ligne")
+    parser.add_argument('--output', required=True, help="Fichier NDJSON de résultats")
+    parser.add_argument('--engines', type=int, default=1, help="Nombre de moteurs, les CPU étant partagés entre eux")
+    parser.add_argument('--depth', type=int, default=None, help="Profondeur de recherche")
+    parser.add_argument('--movetime', type=float, default=None, help="Temps de recherche par position en secondes")
+    parser.add_argument('--multipv', type=int, default=1, help="Nombre de variantes principales")
+    parser.add_argument('--hash', type=int, default=ENGINE_HASH, help="Table de transposition par moteur en Mo")
+    parser.add_argument('--resume', action='store_true', help="Reprend un fichier de résultats existant")
+    args = parser.parse_args()
+
+    if args.depth is None and args.movetime is None:
+        parser.error("--depth ou --movetime est requis")
+    analyse_positions(args.input, args.output, args.engines, args.depth, args.movetime, args.multipv,
+                      args.hash, args.resume)
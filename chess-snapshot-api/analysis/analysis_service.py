@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+
+from analysis.analysis_store import AnalysisStore
+from analysis.engine import DEFAULT_DEPTH, aiter_analysis, analyse_position, iter_analysis
+
+
+class AnalysisService:
+    """Answers analysis requests from the tablebases or opening book, then from the store when it holds a
+    deep enough result, and otherwise with the engine"""
+
+    def __init__(self, store=None, fast_path=None):
+        self.store = store or AnalysisStore()
+        self.fast_path = fast_path
+        self.lock = threading.Lock()
+        self.stats = {'engine_searches': 0, 'engine_seconds': 0.0}
+
+    def lookup(self, fen, depth):
+        """Analysis from the fast path or the store, with its 'source', or None"""
+        if self.fast_path is not None:
+            analysis = self.fast_path.probe(fen)
+            if analysis is not None:
+                return analysis
+
+        analysis = self.store.get(fen, depth)
+        if analysis is not None:
+            return {**analysis, 'source': 'store'}
+        return None
+
+    def record_search(self, fen, analysis, start_time):
+        with self.lock:
+            self.stats['engine_searches'] += 1
+            self.stats['engine_seconds'] += time.perf_counter() - start_time
+        self.store.put(fen, analysis)
+
+    def analyse(self, fen, depth=DEFAULT_DEPTH):
+        analysis = self.lookup(fen, depth)
+        if analysis is not None:
+            return analysis
+
+        start_time = time.perf_counter()
+        analysis = analyse_position(fen, depth)
+        self.record_search(fen, analysis, start_time)
+        return {**analysis, 'source': 'engine'}
+
+    def stream(self, fen, depth=DEFAULT_DEPTH):
+        """Yield the analysis of each search iteration, then the final one with 'final' set
+
+        The final line is always yielded, with a None 'best_move' for checkmate and
+        stalemate positions. A stored or fast path result is yielded at once as the final one. Closing
+        the generator before the end stops the search, and the partial result is
+        not stored.
+        """
+        analysis = self.lookup(fen, depth)
+        if analysis is None:
+            start_time = time.perf_counter()
+            for analysis in iter_analysis(fen, depth):
+                yield {**analysis, 'source': 'engine', 'final': False}
+            self.record_search(fen, analysis, start_time)
+            analysis = {**analysis, 'source': 'engine'}
+        yield {**analysis, 'final': True}
+
+    async def astream(self, fen, depth=DEFAULT_DEPTH):
+        """stream() for event loops: cancelling the consuming task stops the search"""
+        analysis = await asyncio.to_thread(self.lookup, fen, depth)
+        if analysis is None:
+            start_time = time.perf_counter()
+            async for analysis in aiter_analysis(fen, depth):
+                yield {**analysis, 'source': 'engine', 'final': False}
+            await asyncio.to_thread(self.record_search, fen, analysis, start_time)
+            analysis = {**analysis, 'source': 'engine'}
+        yield {**analysis, 'final': True}
+
+    def get_stats(self):
+        """Store and fast path counters, with the engine time saved by the fast path estimated from the mean
+        engine search time"""
+        with self.lock:
+            stats = dict(self.stats)
+        stats['store'] = self.store.get_stats()
+        if self.fast_path is not None:
+            fast_path = self.fast_path.get_stats()
+            hits = fast_path['tablebase_hits'] + fast_path['book_hits']
+            mean_engine_seconds = stats['engine_seconds'] / stats['engine_searches'] if stats['engine_searches'] else 0.0
+            fast_path['saved_seconds'] = max(0.0, hits * mean_engine_seconds - fast_path['probe_seconds'])
+            stats['fast_path'] = fast_path
+        return stats
@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import chess
+
+
+def normalize_fen(fen):
+    """Position key ignoring move counters: pieces, side to move, castling rights and legal en passant square"""
+    return chess.Board(fen).epd()
+
+
+class AnalysisStore:
+    """Engine analyses keyed by normalized FEN, with an in-memory LRU tier and an optional SQLite tier
+
+    An analysis is a dict with 'depth', 'score', 'best_move' and 'pv'. A stored
+    analysis answers any request for the same or a shallower depth, and is only
+    replaced by a deeper one. The SQLite file uses WAL mode so that several
+    worker processes can share it, each with its own connection: one opened
+    before a fork is never used by the child.
+    """
+    MAX_ENTRIES = 100000
+
+    def __init__(self, max_entries=MAX_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        self.path = path
+        self.connection = None
+        self.connection_pid = None
+        # Connections inherited through fork: closing them in the child could checkpoint
+        # and delete the WAL file the parent still uses, so they are only kept referenced
+        self.inherited_connections = []
+
+    @property
+    def db(self):
+        """SQLite connection of the current process, opened on first use, or None without a path"""
+        if not self.path:
+            return None
+        if self.connection_pid != os.getpid():
+            if self.connection is not None:
+                self.inherited_connections.append(self.connection)
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS analyses '
+                                    '(key TEXT PRIMARY KEY, depth INTEGER, analysis TEXT, updated REAL)')
+            self.connection.commit()
+            self.connection_pid = os.getpid()
+        return self.connection
+
+    def close(self):
+        """Close the connection of this process, before forking workers for instance"""
+        with self.lock:
+            if self.connection is not None and self.connection_pid == os.getpid():
+                self.connection.close()
+            self.connection = None
+            self.connection_pid = None
+
+    def remember(self, key, analysis):
+        """Keep an analysis in the memory tier unless a deeper one is already there"""
+        current = self.entries.get(key)
+        if current is None or analysis['depth'] >= current['depth']:
+            self.entries[key] = analysis
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, fen, depth):
+        """Stored analysis of the position searched to at least depth, or None"""
+        key = normalize_fen(fen)
+        with self.lock:
+            analysis = self.entries.get(key)
+            if analysis is not None and analysis['depth'] >= depth:
+                self.entries.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return analysis
+
+            db = self.db
+            if db is not None:
+                row = db.execute('SELECT analysis FROM analyses WHERE key = ? AND depth >= ?',
+                                 (key, depth)).fetchone()
+                if row is not None:
+                    analysis = json.loads(row[0])
+                    self.remember(key, analysis)
+                    self.stats['disk_hits'] += 1
+                    return analysis
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, fen, analysis):
+        """Store an analysis, replacing a stored one only if it is not deeper"""
+        key = normalize_fen(fen)
+        with self.lock:
+            self.remember(key, analysis)
+            db = self.db
+            if db is not None:
+                db.execute('INSERT INTO analyses VALUES (?, ?, ?, ?) '
+                           'ON CONFLICT(key) DO UPDATE SET depth = excluded.depth, '
+                           'analysis = excluded.analysis, updated = excluded.updated '
+                           'WHERE excluded.depth >= analyses.depth',
+                           (key, analysis['depth'], json.dumps(analysis), time.time()))
+                db.commit()
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, 'entries': len(self.entries), 'max_entries': self.max_entries}
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import chess
+import chess.engine
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from thread_budget import ThreadBudget
+
+STOCKFISH_PATH = os.environ.get('STOCKFISH_PATH', './stockfish/stockfish-16.1')
+DEFAULT_DEPTH = 15
+ENGINE_HASH = 16
+
+
+def open_engine(stockfish_path=STOCKFISH_PATH, threads=None, hash_size=ENGINE_HASH):
+    """Start a UCI engine process sized to the thread budget"""
+    engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
+    try:
+        engine.configure({'Threads': threads or ThreadBudget().engine_threads, 'Hash': hash_size})
+    except Exception:
+        engine.quit()
+        raise
+    return engine
+
+def score_to_dict(score):
+    """Score from the point of view of the side to move, as {'cp': n} or {'mate': n}"""
+    relative = score.relative
+    if relative.is_mate():
+        return {'mate': relative.mate()}
+    return {'cp': relative.score()}
+
+def analysis_from_info(info):
+    """Depth, score, best move and principal variation of an engine info dict"""
+    pv = [move.uci() for move in info.get('pv', [])]
+    return {
+        'depth': info.get('depth', 0),
+        'score': score_to_dict(info['score']) if 'score' in info else None,
+        'best_move': pv[0] if pv else None,
+        'pv': pv,
+    }
+
+def completed_iteration(info):
+    """Analysis of an info line ending a search iteration, or None for progress and bound lines"""
+    if 'score' not in info or not info.get('pv') or info.get('lowerbound') or info.get('upperbound'):
+        return None
+    return analysis_from_info(info)
+
+def iter_analysis(fen, depth=DEFAULT_DEPTH, engine=None):
+    """Yield the analysis of every iteration of the search up to depth
+
+    A search ending without any completed iteration, as in checkmate and
+    stalemate positions, yields the engine's final info once, without best move.
+    Closing the generator stops the search right away, so that the engine is
+    free again as soon as the consumer goes away.
+    """
+    board = chess.Board(fen)
+    own_engine = engine is None
+    if own_engine:
+        engine = open_engine()
+    try:
+        with engine.analysis(board, chess.engine.Limit(depth=depth)) as analysis:
+            completed = False
+            for info in analysis:
+                iteration = completed_iteration(info)
+                if iteration is not None:
+                    completed = True
+                    yield iteration
+            if not completed:
+                yield analysis_from_info(analysis.info)
+    finally:
+        if own_engine:
+            engine.quit()
+
+async def aiter_analysis(fen, depth=DEFAULT_DEPTH, stockfish_path=STOCKFISH_PATH):
+    """Asynchronous iter_analysis for event loops, with its own engine process; cancelling the task stops the search"""
+    board = chess.Board(fen)
+    _, engine = await chess.engine.popen_uci(stockfish_path)
+    try:
+        await engine.configure({'Threads': ThreadBudget().engine_threads, 'Hash': ENGINE_HASH})
+        with await engine.analysis(board, chess.engine.Limit(depth=depth)) as analysis:
+            completed = False
+            async for info in analysis:
+                iteration = completed_iteration(info)
+                if iteration is not None:
+                    completed = True
+                    yield iteration
+            if not completed:
+                yield analysis_from_info(analysis.info)
+    finally:
+        await engine.quit()
+
+def analyse_position(fen, depth=DEFAULT_DEPTH, engine=None):
+    """Search the position to depth, with a fresh engine process unless one is given"""
+    board = chess.Board(fen)
+    if engine is None:
+        with open_engine() as engine:
+            info = engine.analyse(board, chess.engine.Limit(depth=depth))
+    else:
+        info = engine.analyse(board, chess.engine.Limit(depth=depth))
+    return analysis_from_info(info)
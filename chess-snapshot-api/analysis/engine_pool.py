@@ -0,0 +1,85 @@
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import chess.engine
+
+from analysis.engine import ENGINE_HASH, STOCKFISH_PATH, open_engine
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from thread_budget import ThreadBudget
+
+
+class EnginePool:
+    """Persistent engine processes sharing one CPU budget, each searching one position at a time
+
+    The available CPUs are split evenly between the engines. An engine that
+    dies is replaced by a new one before being handed out again.
+    """
+
+    def __init__(self, size, threads=None, hash_size=ENGINE_HASH, stockfish_path=STOCKFISH_PATH):
+        self.size = size
+        self.threads = threads or ThreadBudget(workers=size).threads
+        self.hash_size = hash_size
+        self.stockfish_path = stockfish_path
+        self.engines = queue.Queue()
+        self.all_engines = []
+        self.lock = threading.Lock()
+        for _ in range(size):
+            self.engines.put(self.start_engine())
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='engine-pool')
+
+    def start_engine(self):
+        engine = open_engine(self.stockfish_path, self.threads, self.hash_size)
+        with self.lock:
+            self.all_engines.append(engine)
+        return engine
+
+    def replace_engine(self, engine):
+        with self.lock:
+            if engine in self.all_engines:
+                self.all_engines.remove(engine)
+        try:
+            engine.close()
+        except Exception:
+            pass
+        return self.start_engine()
+
+    @contextmanager
+    def engine(self):
+        """Check out an idle engine for the duration of the block"""
+        engine = self.engines.get()
+        try:
+            yield engine
+        except chess.engine.EngineTerminatedError:
+            engine = self.replace_engine(engine)
+            raise
+        finally:
+            self.engines.put(engine)
+
+    def run(self, function, *args):
+        """Call function(engine, *args) with an idle engine"""
+        with self.engine() as engine:
+            return function(engine, *args)
+
+    def submit(self, function, *args):
+        """Schedule function(engine, *args) on the next idle engine, returning a future"""
+        return self.executor.submit(self.run, function, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            engines, self.all_engines = self.all_engines, []
+        for engine in engines:
+            try:
+                engine.quit()
+            except Exception:
+                engine.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+
+import chess
+import chess.polyglot
+import chess.syzygy
+
+
+class FastPath:
+    """Answers a position from local Syzygy tablebases or a Polyglot opening book without searching
+
+    Tablebases are probed for positions with at most as many pieces as the
+    largest table found and no castling rights; the best move is the one that
+    wins fastest, or loses slowest, by distance to zeroing (DTZ). Book positions
+    are answered with their most weighted move. Both are file lookups that take
+    microseconds where the engine needs a full search.
+    """
+
+    def __init__(self, tablebase_path=None, book_path=None):
+        self.lock = threading.Lock()
+        self.stats = {'tablebase_hits': 0, 'book_hits': 0, 'misses': 0, 'probe_seconds': 0.0}
+
+        self.tablebase = None
+        self.max_pieces = 0
+        if tablebase_path:
+            self.tablebase = chess.syzygy.Tablebase()
+            for directory in tablebase_path.split(os.pathsep):
+                self.tablebase.add_directory(directory)
+            # Table names such as KQvKR list their pieces
+            self.max_pieces = max((len(name) - 1 for name in self.tablebase.wdl), default=0)
+
+        self.book = chess.polyglot.open_reader(book_path) if book_path else None
+
+    def probe_tablebase(self, board):
+        if self.tablebase is None or chess.popcount(board.occupied) > self.max_pieces or board.castling_rights:
+            return None
+        wdl = self.tablebase.get_wdl(board)
+        dtz = self.tablebase.get_dtz(board)
+        if wdl is None or dtz is None:
+            return None
+
+        best_move, best_key = None, None
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    key = (2, 0)
+                else:
+                    child_wdl = self.tablebase.get_wdl(board)
+                    child_dtz = self.tablebase.get_dtz(board)
+                    if child_wdl is None or child_dtz is None:
+                        return None
+                    # Our result first, then the highest opponent DTZ: the shortest win or the longest loss
+                    key = (-child_wdl, child_dtz)
+            finally:
+                board.pop()
+            if best_key is None or key > best_key:
+                best_move, best_key = move, key
+
+        if best_move is None:
+            return None
+        return {
+            'depth': None,
+            'score': {'wdl': wdl, 'dtz': dtz},
+            'best_move': best_move.uci(),
+            'pv': [best_move.uci()],
+        }
+
+    def probe_book(self, board):
+        if self.book is None:
+            return None
+        entries = list(self.book.find_all(board))
+        if not entries:
+            return None
+        best = max(entries, key=lambda entry: entry.weight)
+        return {
+            'depth': None,
+            'score': None,
+            'best_move': best.move.uci(),
+            'pv': [best.move.uci()],
+            'book_moves': [{'move': entry.move.uci(), 'weight': entry.weight} for entry in entries],
+        }
+
+    def probe(self, fen):
+        """Analysis of the position from the tablebases or the book, with its 'source', or None"""
+        start_time = time.perf_counter()
+        board = chess.Board(fen)
+        analysis, source = self.probe_tablebase(board), 'tablebase'
+        if analysis is None:
+            analysis, source = self.probe_book(board), 'book'
+
+        with self.lock:
+            self.stats['probe_seconds'] += time.perf_counter() - start_time
+            if analysis is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats[f'{source}_hits'] += 1
+        return {**analysis, 'source': source}
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def close(self):
+        if self.tablebase is not None:
+            self.tablebase.close()
+        if self.book is not None:
+            self.book.close()
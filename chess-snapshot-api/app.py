@@ -1,13 +1,61 @@
-import cv2 as cv
-import numpy as np
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
 
-from flask import Flask, request, jsonify
-from stockfish import Stockfish
+from flask import Flask, Response, request, jsonify
+from analysis.analysis_service import AnalysisService
+from analysis.analysis_store import AnalysisStore, normalize_fen
+from analysis.engine import DEFAULT_DEPTH
+from analysis.fast_path import FastPath
 from detectors.chess_position_detector import ChessPositionDetector
+from utils import instrumentation, profiling
+from utils.frame_context import FrameContext
+from utils.image_io import decode_image
+from utils.position_cache import PositionCache, content_hash
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from thread_budget import ThreadBudget
 
 
 app = Flask(__name__)
 
+_chess_position_detector = None
+_chess_position_detector_lock = threading.Lock()
+# The detector keeps per-call state, so requests of a process use it one at a time
+_detection_lock = threading.Lock()
+
+# Limits of a zip uploaded to the batch endpoint, checked before anything is decompressed
+MAX_ARCHIVE_FILES = int(os.environ.get('CHESS_ARCHIVE_MAX_FILES', 1000))
+MAX_ARCHIVE_FILE_SIZE = int(os.environ.get('CHESS_ARCHIVE_MAX_FILE_SIZE', 20 * 1024 * 1024))
+MAX_ARCHIVE_SIZE = int(os.environ.get('CHESS_ARCHIVE_MAX_SIZE', 200 * 1024 * 1024))
+
+position_cache = PositionCache(
+    max_entries=int(os.environ.get('CHESS_CACHE_SIZE', PositionCache.MAX_ENTRIES)),
+    path=os.environ.get('CHESS_CACHE_PATH'),
+    perceptual=os.environ.get('CHESS_CACHE_PERCEPTUAL', '0') == '1',
+)
+
+analysis_service = AnalysisService(AnalysisStore(
+    max_entries=int(os.environ.get('CHESS_ANALYSIS_CACHE_SIZE', AnalysisStore.MAX_ENTRIES)),
+    path=os.environ.get('CHESS_ANALYSIS_PATH'),
+), FastPath(
+    tablebase_path=os.environ.get('CHESS_SYZYGY_PATH'),
+    book_path=os.environ.get('CHESS_BOOK_PATH'),
+))
+
+
+def get_chess_position_detector():
+    """Process-wide detector, created on first use so that its models are loaded once"""
+    global _chess_position_detector
+    with _chess_position_detector_lock:
+        if _chess_position_detector is None:
+            ThreadBudget().apply()
+            _chess_position_detector = ChessPositionDetector()
+        return _chess_position_detector
+
 @app.route('/')
 def hello_chess_snapshot():
     return 'Hello, Chess Snapshot!'
@@ -20,24 +68,171 @@ def get_chess_position():
     image_file = request.files['image']
     image_bytes = image_file.read()
 
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    original_image = cv.imdecode(nparr, cv.IMREAD_COLOR)
+    image_key = content_hash(image_bytes)
+    # A profiled request runs the detection even when its position is cached
+    profile_requested = profiling.should_profile(profiling.is_requested(request.headers, request.args))
+    if request.args.get('multi') == '1':
+        return get_chess_positions_of_page(image_key, image_bytes, profile_requested)
 
-    chess_position_detector = ChessPositionDetector()
-    fen = chess_position_detector.detect(original_image)
+    cached = None if profile_requested else position_cache.get(image_key)
+    if cached is not None:
+        return jsonify({'fen': cached['fen'], 'confidence': cached['confidence'], 'cache': 'exact'})
 
-    return jsonify({'fen': fen})
+    with instrumentation.trace() as request_trace, profiling.profile(profile_requested) as profile_session:
+        decode_start_time = time.perf_counter()
+        with instrumentation.stage('decode'):
+            original_image = decode_image(image_bytes, FrameContext.MAX_SIZE)
+        decode_time = (time.perf_counter() - decode_start_time) * 1000
+        if original_image is None:
+            return 'Invalid image', 400
 
-@app.route('/api/get_best_move', methods=['POST'])
-def get_best_move():
+        cached = None if profile_requested else position_cache.get_similar(original_image)
+        if cached is not None:
+            return jsonify({'fen': cached['fen'], 'confidence': cached['confidence'], 'cache': 'perceptual'})
+
+        chess_position_detector = get_chess_position_detector()
+        with _detection_lock:
+            fen = chess_position_detector.detect(original_image)
+            confidence = chess_position_detector.confidence
+            timings = {'decode': decode_time, **chess_position_detector.timings}
+    position_cache.put(image_key, original_image, fen, confidence)
+
+    response = {'fen': fen, 'confidence': confidence, 'cache': None, 'timings': timings}
+    if request.args.get('trace') == '1' and request_trace is not None:
+        response['trace'] = request_trace.to_dict()
+    if profile_session is not None:
+        trace = request_trace.to_dict() if request_trace is not None else None
+        response['profile'] = os.path.basename(profile_session.dump(image_key, timings, trace))
+    return jsonify(response)
+
+def get_chess_positions_of_page(image_key, image_bytes, profile_requested):
+    """Every board of a page holding several diagrams, which the position cache does not cover"""
+    with instrumentation.trace() as request_trace, profiling.profile(profile_requested) as profile_session:
+        decode_start_time = time.perf_counter()
+        with instrumentation.stage('decode'):
+            # Each board of the page is cropped from the full resolution image
+            original_image = decode_image(image_bytes)
+        decode_time = (time.perf_counter() - decode_start_time) * 1000
+        if original_image is None:
+            return 'Invalid image', 400
+
+        chess_position_detector = get_chess_position_detector()
+        with _detection_lock:
+            boards = chess_position_detector.detect_all(original_image)
+            timings = {'decode': decode_time, **chess_position_detector.timings}
+
+    response = {'boards': boards, 'timings': timings}
+    if request.args.get('trace') == '1' and request_trace is not None:
+        response['trace'] = request_trace.to_dict()
+    if profile_session is not None:
+        trace = request_trace.to_dict() if request_trace is not None else None
+        response['profile'] = os.path.basename(profile_session.dump(image_key, timings, trace))
+    return jsonify(response)
+
+class ArchiveTooLargeError(Exception):
+    pass
+
+
+def read_uploaded_images():
+    """Read (name, bytes) pairs from the 'images' files or from a zip uploaded as 'archive'
+
+    Raises ArchiveTooLargeError when the zip holds more files, or larger ones, than allowed.
+    """
+    uploads = []
+    for image_file in request.files.getlist('images'):
+        uploads.append((image_file.filename, image_file.read()))
+
+    if 'archive' in request.files:
+        with zipfile.ZipFile(io.BytesIO(request.files['archive'].read())) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            # Sizes come from the archive directory; zipfile never decompresses more than they declare
+            if len(members) > MAX_ARCHIVE_FILES:
+                raise ArchiveTooLargeError(f'More than {MAX_ARCHIVE_FILES} files in the archive')
+            if any(info.file_size > MAX_ARCHIVE_FILE_SIZE for info in members):
+                raise ArchiveTooLargeError(f'Archive file larger than {MAX_ARCHIVE_FILE_SIZE} bytes')
+            if sum(info.file_size for info in members) > MAX_ARCHIVE_SIZE:
+                raise ArchiveTooLargeError(f'Archive larger than {MAX_ARCHIVE_SIZE} bytes uncompressed')
+            for info in members:
+                uploads.append((info.filename, archive.read(info)))
+
+    return uploads
+
+@app.route('/api/get_chess_positions', methods=['POST'])
+def get_chess_positions():
+    try:
+        uploads = read_uploaded_images()
+    except zipfile.BadZipFile:
+        return 'Invalid archive', 400
+    except ArchiveTooLargeError as e:
+        return str(e), 413
+    if not uploads:
+        return 'No image uploaded', 400
+
+    positions = [{'name': name} for name, _ in uploads]
+    images = []
+    image_indices = []
+    for index, (_, image_bytes) in enumerate(uploads):
+        image = decode_image(image_bytes, FrameContext.MAX_SIZE)
+        if image is None:
+            positions[index]['error'] = 'Invalid image'
+            continue
+        images.append(image)
+        image_indices.append(index)
+
+    chess_position_detector = get_chess_position_detector()
+    with _detection_lock:
+        results = chess_position_detector.detect_batch(images)
+        timings = chess_position_detector.timings
+
+    for index, result in zip(image_indices, results):
+        if isinstance(result, Exception):
+            positions[index]['error'] = str(result) or type(result).__name__
+        else:
+            positions[index]['fen'] = result
+
+    return jsonify({'positions': positions, 'timings': timings})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(instrumentation.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({**position_cache.get_stats(), 'analysis': analysis_service.get_stats()})
+
+def read_analysis_request():
+    """FEN and depth of an analysis request, raising ValueError when either is invalid"""
     data = request.get_json()
     fen = data['fen']
+    depth = int(data.get('depth', DEFAULT_DEPTH))
+    normalize_fen(fen)
+    return fen, depth
+
+@app.route('/api/get_best_move', methods=['POST'])
+def get_best_move():
+    try:
+        fen, depth = read_analysis_request()
+    except ValueError as e:
+        return str(e), 400
+
+    analysis = analysis_service.analyse(fen, depth)
+
+    return jsonify(analysis)
+
+@app.route('/api/stream_best_move', methods=['POST'])
+def stream_best_move():
+    # Checked before the response starts, since errors can not change its status afterwards
+    try:
+        fen, depth = read_analysis_request()
+    except ValueError as e:
+        return str(e), 400
 
-    stockfish = Stockfish(path='./stockfish/stockfish-16.1')
-    stockfish.set_fen_position(fen)
-    best_move = stockfish.get_best_move()
+    def generate():
+        # A client disconnect closes this generator, which stops the search
+        for analysis in analysis_service.stream(fen, depth):
+            yield json.dumps(analysis) + '\n'
 
-    return jsonify({'best_move': best_move})
+    return Response(generate(), mimetype='application/x-ndjson')
 
 if __name__ == '__main__':
     app.run(port=8080)
@@ -0,0 +1,254 @@
+"""
+ASGI serving mode for the Chess Snapshot API.
+
+Detection is CPU bound, so it runs in a pool of worker processes, each holding
+its own warmed-up ChessPositionDetector. The number of requests waiting for or
+running in the pool is bounded: when the bound is reached new requests are
+rejected with 503 instead of queueing behind slow images. Each request has a
+timeout (504), and requests whose client disconnects are cancelled while they
+are still queued. A detection that has already started keeps its worker, and
+its place in the bound, until it finishes; the client simply stops waiting for it.
+
+    uvicorn asgi:app --port 8080
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+WORKERS = int(os.environ.get('CHESS_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+MAX_PENDING = int(os.environ.get('CHESS_MAX_PENDING', WORKERS * 2))
+REQUEST_TIMEOUT = float(os.environ.get('CHESS_REQUEST_TIMEOUT', 30))
+ENGINE_TIMEOUT = float(os.environ.get('CHESS_ENGINE_TIMEOUT', 30))
+DISCONNECT_POLL_INTERVAL = 0.1
+
+_detector = None
+
+
+def init_worker(ready_workers):
+    """Load and warm up the detector of a worker process"""
+    global _detector
+    from detectors.chess_position_detector import ChessPositionDetector
+    from thread_budget import ThreadBudget
+
+    ThreadBudget(workers=WORKERS).apply()
+    _detector = ChessPositionDetector()
+    _detector.warmup()
+    with ready_workers.get_lock():
+        ready_workers.value += 1
+
+def wait_for_workers(ready_workers, workers, timeout):
+    """Block a worker until every worker has warmed up, which makes the pool start all of them"""
+    deadline = time.monotonic() + timeout
+    while ready_workers.value < workers and time.monotonic() < deadline:
+        time.sleep(0.1)
+    return ready_workers.value
+
+def detect_position(image_bytes, profile=False, multi=False):
+    """Decode an uploaded image and detect its position, or with multi the positions of all its boards,
+    in a worker process, under the profiler if asked"""
+    from utils import profiling
+    from utils.frame_context import FrameContext
+    from utils.image_io import decode_image
+    from utils.position_cache import content_hash
+
+    with profiling.profile(profile) as profile_session:
+        decode_start_time = time.perf_counter()
+        # The boards of a page are cropped from the full resolution image
+        image = decode_image(image_bytes, None if multi else FrameContext.MAX_SIZE)
+        decode_time = (time.perf_counter() - decode_start_time) * 1000
+        if image is None:
+            raise ValueError('Invalid image')
+
+        if multi:
+            result = {'boards': _detector.detect_all(image)}
+        else:
+            result = {'fen': _detector.detect(image)}
+    result['timings'] = {'decode': decode_time, **_detector.timings}
+    if profile_session is not None:
+        result['profile'] = os.path.basename(profile_session.dump(content_hash(image_bytes), result['timings']))
+    return result
+
+
+class DetectionPool:
+    """Process pool with a bounded number of in-flight requests"""
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        context = multiprocessing.get_context('spawn')
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.ready_workers = context.Value('i', 0)
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                            initializer=init_worker, initargs=(self.ready_workers,))
+
+    @property
+    def ready(self):
+        return self.ready_workers.value >= self.workers
+
+    def start(self, timeout=600):
+        """Start and warm up every worker in the background"""
+        for _ in range(self.workers):
+            self.executor.submit(wait_for_workers, self.ready_workers, self.workers, timeout)
+
+    async def run(self, request, function, *args, timeout=REQUEST_TIMEOUT):
+        """Run function in the pool, cancelling it on timeout or when the client disconnects"""
+        if self.pending >= self.max_pending:
+            raise PoolFullError()
+
+        loop = asyncio.get_running_loop()
+        future = self.executor.submit(function, *args)
+        self.pending += 1
+        # The slot is released when the worker is done with the job, not when the request gives up on it
+        future.add_done_callback(lambda _: self.release(loop))
+        job = asyncio.wrap_future(future)
+        deadline = time.monotonic() + timeout
+        while not job.done():
+            if time.monotonic() >= deadline:
+                job.cancel()
+                raise asyncio.TimeoutError()
+            if await request.is_disconnected():
+                job.cancel()
+                raise ClientDisconnectedError()
+            await asyncio.wait({job}, timeout=DISCONNECT_POLL_INTERVAL)
+        return job.result()
+
+    def release(self, loop):
+        """Free the slot of a finished or cancelled job, from the thread that completed it"""
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # The event loop is closed when jobs finish after shutdown
+            pass
+
+    def _release(self):
+        self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PoolFullError(Exception):
+    pass
+
+
+class ClientDisconnectedError(Exception):
+    pass
+
+
+pool = None
+analysis_service = None
+
+
+async def hello_chess_snapshot(request):
+    return PlainTextResponse('Hello, Chess Snapshot!')
+
+async def ready(request):
+    if pool is not None and pool.ready:
+        return JSONResponse({'ready': True, 'workers': pool.workers})
+    ready_workers = pool.ready_workers.value if pool is not None else 0
+    return JSONResponse({'ready': False, 'workers': ready_workers}, status_code=503)
+
+async def get_chess_position(request):
+    from utils import profiling
+
+    form = await request.form()
+    if 'image' not in form:
+        return PlainTextResponse('No image uploaded', status_code=400)
+    image_bytes = await form['image'].read()
+    profile = profiling.should_profile(profiling.is_requested(request.headers, request.query_params))
+
+    try:
+        result = await pool.run(request, detect_position, image_bytes, profile,
+                                request.query_params.get('multi') == '1')
+    except PoolFullError:
+        return PlainTextResponse('Too many pending requests', status_code=503, headers={'Retry-After': '1'})
+    except asyncio.TimeoutError:
+        return PlainTextResponse('Detection timed out', status_code=504)
+    except ClientDisconnectedError:
+        return PlainTextResponse('Client disconnected', status_code=499)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+
+    return JSONResponse(result)
+
+async def read_analysis_request(request):
+    """FEN and depth of an analysis request, raising ValueError when either is invalid"""
+    from analysis.analysis_store import normalize_fen
+    from analysis.engine import DEFAULT_DEPTH
+
+    data = await request.json()
+    fen = data['fen']
+    depth = int(data.get('depth', DEFAULT_DEPTH))
+    normalize_fen(fen)
+    return fen, depth
+
+async def get_best_move(request):
+    try:
+        fen, depth = await read_analysis_request(request)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+
+    try:
+        analysis = await asyncio.wait_for(asyncio.to_thread(analysis_service.analyse, fen, depth), ENGINE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return PlainTextResponse('Analysis timed out', status_code=504)
+
+    return JSONResponse(analysis)
+
+async def stream_best_move(request):
+    # Checked before the response starts, since errors can not change its status afterwards
+    try:
+        fen, depth = await read_analysis_request(request)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+
+    async def generate():
+        # A client disconnect cancels this generator, which stops the search
+        async for analysis in analysis_service.astream(fen, depth):
+            yield json.dumps(analysis) + '\n'
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+def startup():
+    global pool, analysis_service
+    from analysis.analysis_service import AnalysisService
+    from analysis.analysis_store import AnalysisStore
+    from analysis.fast_path import FastPath
+
+    analysis_service = AnalysisService(AnalysisStore(
+        max_entries=int(os.environ.get('CHESS_ANALYSIS_CACHE_SIZE', AnalysisStore.MAX_ENTRIES)),
+        path=os.environ.get('CHESS_ANALYSIS_PATH'),
+    ), FastPath(os.environ.get('CHESS_SYZYGY_PATH'), os.environ.get('CHESS_BOOK_PATH')))
+    pool = DetectionPool()
+    pool.start()
+
+def shutdown():
+    pool.shutdown()
+
+
+app = Starlette(
+    routes=[
+        Route('/', hello_chess_snapshot),
+        Route('/ready', ready),
+        Route('/api/get_chess_position', get_chess_position, methods=['POST']),
+        Route('/api/get_best_move', get_best_move, methods=['POST']),
+        Route('/api/stream_best_move', stream_best_move, methods=['POST']),
+    ],
+    on_startup=[startup],
+    on_shutdown=[shutdown],
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, port=8080)
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
+from detectors.chess_position_detector import ChessPositionDetector
+from utils import instrumentation
+from utils.corpus import iter_labelled_images
+from utils.fen import EMPTY_SQUARE, fen_to_board, square_accuracy
+
+PERCENTILES = (50, 95, 99)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentiles(values):
+    return {f'p{p}_ms': float(np.percentile(values, p)) for p in PERCENTILES}
+
+def compare_boards(predicted_fen, expected_fen, correct_by_square, total_by_class, correct_by_class):
+    """Accumulate per-square and per-class hits of one prediction"""
+    predicted = fen_to_board(predicted_fen) if predicted_fen else []
+    expected = fen_to_board(expected_fen)
+    for row in range(8):
+        for col in range(8):
+            expected_class = expected[row][col]
+            total_by_class[expected_class] = total_by_class.get(expected_class, 0) + 1
+            if row < len(predicted) and col < len(predicted[row]) and predicted[row][col] == expected_class:
+                correct_by_square[row][col] += 1
+                correct_by_class[expected_class] = correct_by_class.get(expected_class, 0) + 1
+
+def benchmark_corpus(corpus_dir, mode=ChessPositionDetector.MODE_PIECES, repeat=1, trace_memory=False,
+                     low_memory=False):
+    """Run the detector over a labelled corpus and measure speed, memory and accuracy"""
+    samples = [(path, fen) for path, fen in iter_labelled_images(corpus_dir)]
+    if not samples:
+        print(f"Aucune image annotée trouvée dans {corpus_dir}")
+        return None
+
+    detector = ChessPositionDetector(mode=mode, low_memory=low_memory)
+    detector.warmup()
+
+    # Peaks per stage, sampled RSS and with --trace-memory Python allocations
+    memory_tracker = instrumentation.set_memory_tracking('all' if trace_memory else 'rss')
+
+    stage_times = {}
+    totals = []
+    failures = 0
+    exact_matches = 0
+    accuracies = []
+    correct_by_square = [[0] * 8 for _ in range(8)]
+    total_by_class = {}
+    correct_by_class = {}
+
+    start_time = time.perf_counter()
+    for path, expected_fen in samples:
+        image = cv.imread(path, cv.IMREAD_COLOR)
+        fen = None
+        for _ in range(repeat):
+            with instrumentation.trace() as request_trace:
+                try:
+                    fen = detector.detect(image)
+                except Exception as e:
+                    print(f"Erreur ({os.path.basename(path)}): {e}")
+                    fen = None
+                    failures += 1
+
+            stages = {}
+            if request_trace is not None:
+                # Stages repeated for each board layer add up
+                for stage in request_trace.to_dict()['stages']:
+                    stages[stage['stage']] = stages.get(stage['stage'], 0) + stage['ms']
+            for stage, ms in detector.timings.items():
+                stages.setdefault(stage, ms)
+            for stage, ms in stages.items():
+                stage_times.setdefault(stage, []).append(ms)
+            if 'total' in detector.timings:
+                totals.append(detector.timings['total'])
+
+        accuracies.append(square_accuracy(fen, expected_fen) if fen else 0.0)
+        if fen == expected_fen.split()[0]:
+            exact_matches += 1
+        compare_boards(fen, expected_fen, correct_by_square, total_by_class, correct_by_class)
+    elapsed = time.perf_counter() - start_time
+
+    stage_memory = instrumentation.memory_peaks()
+    traced_peak = memory_tracker.traced_peak if trace_memory else None
+    instrumentation.set_memory_tracking('0')
+    if trace_memory:
+        tracemalloc.stop()
+
+    detections = len(samples) * repeat
+    return {
+        'corpus': os.path.abspath(corpus_dir),
+        'mode': mode,
+        'low_memory': low_memory,
+        'images': len(samples),
+        'repeat': repeat,
+        'commit': git_commit(),
+        'machine': {'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'timestamp': time.time(),
+        'throughput': detections / elapsed,
+        'failures': failures,
+        'latency': {'mean_ms': float(np.mean(totals)) if totals else None, **(percentiles(totals) if totals else {})},
+        'stages': {stage: {'mean_ms': float(np.mean(times)), **percentiles(times)} for stage, times in stage_times.items()},
+        'memory': {
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'traced_peak': traced_peak,
+            'stages': stage_memory,
+        },
+        'accuracy': {
+            'fen': exact_matches / len(samples),
+            'square': float(np.mean(accuracies)),
+            'by_square': [[correct / len(samples) for correct in row] for row in correct_by_square],
+            'by_class': {piece_class: correct_by_class.get(piece_class, 0) / total
+                         for piece_class, total in sorted(total_by_class.items())},
+        },
+    }
+
+def print_results(results):
+    print(f"📂 {results['images']} images x {results['repeat']}, mode {results['mode']}")
+    print(f"   Débit: {results['throughput']:.2f} images/s, {results['failures']} échec(s)")
+    latency = results['latency']
+    if latency['mean_ms'] is not None:
+        print(f"   Latence: moyenne {latency['mean_ms']:.1f}ms, p50 {latency['p50_ms']:.1f}ms, "
+              f"p95 {latency['p95_ms']:.1f}ms, p99 {latency['p99_ms']:.1f}ms")
+    print("   Étapes (p50 / p95 / p99):")
+    for stage, times in sorted(results['stages'].items(), key=lambda item: -item[1]['p50_ms']):
+        print(f"      {stage:<20} {times['p50_ms']:8.2f} / {times['p95_ms']:8.2f} / {times['p99_ms']:8.2f} ms")
+    memory = results['memory']
+    print(f"   Mémoire: pic RSS {memory['peak_rss'] / 2**20:.0f} Mo" +
+          (f", pic Python {memory['traced_peak'] / 2**20:.1f} Mo" if memory['traced_peak'] is not None else ""))
+    for stage, peaks in sorted(memory.get('stages', {}).items(), key=lambda item: -item[1]['peak_rss']):
+        print(f"      {stage:<20} RSS {peaks['peak_rss'] / 2**20:8.0f} Mo" +
+              (f", Python +{peaks['peak_traced'] / 2**20:.1f} Mo" if 'peak_traced' in peaks else ""))
+    accuracy = results['accuracy']
+    print(f"   FEN exactes: {accuracy['fen'] * 100:.1f}%, cases correctes: {accuracy['square'] * 100:.1f}%")
+    print("   Par classe: " + ", ".join(f"{'vide' if piece_class == EMPTY_SQUARE else piece_class} "
+                                         f"{rate * 100:.0f}%" for piece_class, rate in accuracy['by_class'].items()))
+
+def print_comparison(results, baseline):
+    """Relative change of the main figures against a previous run"""
+    def change(current, previous, higher_is_better):
+        if not previous or current is None:
+            return "n/a"
+        delta = (current - previous) / previous * 100
+        better = delta >= 0 if higher_is_better else delta <= 0
+        return f"{delta:+.1f}% {'✅' if better else '⚠️'}"
+
+    print(f"\n🔍 Comparaison avec {baseline.get('commit') or 'la référence'}:")
+    print(f"   Débit: {change(results['throughput'], baseline['throughput'], True)}")
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        print(f"   Latence {key[:-3]}: {change(results['latency'].get(key), baseline['latency'].get(key), False)}")
+    print(f"   Pic RSS: {change(results['memory']['peak_rss'], baseline['memory']['peak_rss'], False)}")
+    for key in ('fen', 'square'):
+        delta = (results['accuracy'][key] - baseline['accuracy'][key]) * 100
+        print(f"   Précision {key}: {delta:+.2f} points {'✅' if delta >= 0 else '⚠️'}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mesure débit, latence par étape, mémoire et précision sur un corpus annoté")
+    parser.add_argument('corpus', help="Dossier d'images accompagnées de fichiers <nom>.fen")
+    parser.add_argument('--mode', choices=(ChessPositionDetector.MODE_PIECES, ChessPositionDetector.MODE_SQUARES),
+                        default=ChessPositionDetector.MODE_PIECES, help="Mode de détection")
+    parser.add_argument('--repeat', type=int, default=1, help="Nombre de détections par image")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Mesure le pic d'allocations Python avec tracemalloc (ralentit la détection)")
+    parser.add_argument('--low-memory', action='store_true',
+                        help="Détecteur en mode mémoire réduite, pour le comparer au mode normal")
+    parser.add_argument('--output', help="Fichier JSON où enregistrer les résultats")
+    parser.add_argument('--compare', help="Fichier JSON d'une exécution précédente à comparer")
+    args = parser.parse_args()
+
+    results = benchmark_corpus(args.corpus, args.mode, args.repeat, args.trace_memory, args.low_memory)
+    if results is not None:
+        print_results(results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                print_comparison(results, json.load(f))
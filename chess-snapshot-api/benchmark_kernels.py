@@ -0,0 +1,216 @@
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from utils.geometry import isect_segments
+from utils.hough_bundler import HoughBundler
+from utils.llr import LLR
+from utils.other import median_distance
+
+IMAGE_SIZE = 700
+SIZES = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# LLR needs crossing lines framing the board, from 12 lines, and scores about n^4 line pairs:
+# 100 noisy lines already take minutes
+LLR_SIZES = (12, 16, 20, 30, 40, 50)
+TIME_LIMIT = 5.0
+TOLERANCE = 0.25
+SLOPE_TOLERANCE = 0.3
+GRID_ORDER = (0, 8, 1, 7, 2, 6, 3, 5, 4)
+
+
+def synthetic_lines(n, seed=0):
+    """n segments shaped like HoughLinesP output: the lines of a slightly skewed 9x9 grid, then random clutter
+
+    Vertical and horizontal grid lines alternate, from the outer ones inwards, so that even a few
+    lines hold crossing pairs framing the board.
+    """
+    rng = np.random.default_rng(seed)
+    lines = []
+    for i in range(min(n, 18)):
+        offset = 80 + GRID_ORDER[i // 2] * 60 + rng.normal(0, 1.5)
+        skew = rng.normal(0, 4)
+        if i % 2 == 0:
+            lines.append([offset, 60, offset + skew, 640])
+        else:
+            lines.append([60, offset, 640, offset + skew])
+    while len(lines) < n:
+        x1, y1 = rng.uniform(0, IMAGE_SIZE, 2)
+        angle = rng.choice([0, math.pi / 2]) + rng.normal(0, 0.2)
+        length = rng.uniform(40, 400)
+        lines.append([x1, y1, x1 + length * math.cos(angle), y1 + length * math.sin(angle)])
+    return [np.array([line], dtype=np.int32) for line in np.clip(lines, 0, IMAGE_SIZE - 1)]
+
+def synthetic_points(n, seed=0):
+    """n points: the jittered inner corners of a board, then uniform noise"""
+    rng = np.random.default_rng(seed)
+    points = [(80 + col * 60 + rng.normal(0, 1), 80 + row * 60 + rng.normal(0, 1))
+              for row in range(7) for col in range(7)][:n]
+    while len(points) < n:
+        points.append(tuple(rng.uniform(0, IMAGE_SIZE, 2)))
+    return [(int(x), int(y)) for x, y in points]
+
+def load_intersections_detector():
+    from utils.intersections_detector import IntersectionsDetector
+    return IntersectionsDetector
+
+def kernels():
+    """name -> (setup(n) returning the call arguments, function, its own sizes or None for the common ones)"""
+    segments = lambda n: ([[(float(a), float(b)), (float(c), float(d))] for a, b, c, d in
+                           (line[0] for line in synthetic_lines(n))],)
+    entries = {
+        'HoughBundler.process_lines': (lambda n: (synthetic_lines(n),),
+                                       lambda lines: HoughBundler(min_distance=10, min_angle=0.5).process_lines(lines),
+                                       None),
+        'median_distance': (lambda n: (synthetic_points(n),), median_distance, None),
+        'geometry.isect_segments': (segments, isect_segments, None),
+        'LLR': (lambda n: (np.zeros((IMAGE_SIZE, IMAGE_SIZE), np.uint8), synthetic_points(max(n, 49)),
+                           synthetic_lines(n)), LLR, LLR_SIZES),
+    }
+    try:
+        # Needs the Keras stack for the lattice model, which these kernels do not use
+        detector = load_intersections_detector()
+    except ImportError as e:
+        print(f"⚠️ IntersectionsDetector ignoré: {e}", file=sys.stderr)
+    else:
+        entries['IntersectionsDetector.get_intersections'] = (lambda n: (synthetic_lines(n),),
+                                                                    detector.get_intersections, None)
+        entries['IntersectionsDetector.cluster_points'] = (lambda n: (synthetic_points(n),),
+                                                                 detector.cluster_points, None)
+    return entries
+
+def time_call(function, args, repeat):
+    """Best of repeat runs in seconds, which is the least disturbed by the rest of the machine"""
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def scaling_exponent(curve):
+    """Slope of log(time) against log(n): about 1 for linear kernels, 2 for quadratic ones"""
+    points = [(n, seconds) for n, seconds in curve.items() if seconds and seconds > 1e-5]
+    if len(points) < 3:
+        return None
+    log_n = np.log([n for n, _ in points])
+    log_t = np.log([seconds for _, seconds in points])
+    return float(np.polyfit(log_n, log_t, 1)[0])
+
+def predicted_time(curve, n):
+    """Time of a run of size n extrapolated from the last two measured sizes, assuming at least linear growth"""
+    (n1, t1), (n2, t2) = list(curve.items())[-2:]
+    exponent = max(1.0, math.log(t2 / t1) / math.log(n2 / n1)) if t1 > 0 and t2 > 0 else 2.0
+    return t2 * (n / n2) ** exponent
+
+def benchmark_kernels(names=None, sizes=None, repeat=3, time_limit=TIME_LIMIT):
+    """Time each kernel on inputs of growing size, skipping the sizes whose run would exceed time_limit seconds
+
+    Without sizes, each kernel runs on its own sizes or on SIZES. The sizes whose
+    run raised are kept under 'failed' with their error.
+    """
+    results = {}
+    for name, (setup, function, kernel_sizes) in kernels().items():
+        if names and name not in names:
+            continue
+        curve = {}
+        failed = {}
+        for n in sorted(sizes or kernel_sizes or SIZES):
+            # A running kernel cannot be interrupted, so stop before a run that would take too long
+            if len(curve) >= 2 and predicted_time(curve, n) > time_limit:
+                print(f"   {name:<42} n={n:<5} ignoré, environ {predicted_time(curve, n):.0f}s prévues")
+                break
+            args = setup(n)
+            try:
+                if not curve:
+                    # Imports and caches filled by the first call would otherwise count in the smallest size
+                    function(*args)
+                seconds = time_call(function, args, repeat)
+            except Exception as e:
+                failed[n] = f"{type(e).__name__}: {e}"
+                print(f"   {name:<42} n={n:<5} échec {failed[n]}")
+                continue
+            curve[n] = seconds
+            print(f"   {name:<42} n={n:<5} {seconds * 1000:10.2f}ms")
+            if seconds > time_limit:
+                break
+        results[name] = {'curve': curve, 'exponent': scaling_exponent(curve), 'failed': failed}
+    return results
+
+def find_regressions(results, baseline, tolerance=TOLERANCE, slope_tolerance=SLOPE_TOLERANCE):
+    """Kernels slower than the baseline by more than tolerance at some size, failing at a size the baseline
+    measured, or scaling worse"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base_curve = {int(n): seconds for n, seconds in baseline[name]['curve'].items()}
+        for n, seconds in result['curve'].items():
+            previous = base_curve.get(n)
+            # Below a millisecond the timer noise dominates
+            if previous and seconds > 1e-3 and seconds > previous * (1 + tolerance):
+                regressions.append(f"{name} n={n}: {previous * 1000:.2f}ms -> {seconds * 1000:.2f}ms")
+        for n, error in result.get('failed', {}).items():
+            if n in base_curve:
+                regressions.append(f"{name} n={n}: échec {error}")
+        exponent, base_exponent = result['exponent'], baseline[name].get('exponent')
+        if exponent is not None and base_exponent is not None and exponent > base_exponent + slope_tolerance:
+            regressions.append(f"{name}: exposant {base_exponent:.2f} -> {exponent:.2f}")
+    return regressions
+
+def plot_curves(results, path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    figure, axis = plt.subplots(figsize=(9, 6))
+    for name, result in results.items():
+        curve = result['curve']
+        if curve:
+            label = name if result['exponent'] is None else f"{name} (n^{result['exponent']:.2f})"
+            axis.loglog(list(curve), [seconds * 1000 for seconds in curve.values()], marker='o', label=label)
+    axis.set_xlabel('n')
+    axis.set_ylabel('ms')
+    axis.grid(True, which='both', alpha=0.3)
+    axis.legend(fontsize='small')
+    figure.savefig(path, bbox_inches='tight')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mesure le temps des noyaux de géométrie et de clustering en fonction de la taille des entrées")
+    parser.add_argument('--kernels', nargs='+', help="Noyaux à mesurer, tous par défaut")
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        help="Tailles d'entrée (lignes ou points), sinon celles de chaque noyau")
+    parser.add_argument('--repeat', type=int, default=3, help="Nombre d'exécutions par taille, la meilleure est gardée")
+    parser.add_argument('--time-limit', type=float, default=TIME_LIMIT,
+                        help="Arrête un noyau avant une exécution qui dépasserait ce temps en secondes")
+    parser.add_argument('--output', help="Fichier JSON où enregistrer les courbes")
+    parser.add_argument('--baseline', help="Fichier JSON de référence pour détecter les régressions")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Ralentissement toléré par rapport à la référence")
+    parser.add_argument('--plot', help="Image PNG des courbes temps / n en échelle log-log")
+    args = parser.parse_args()
+
+    results = benchmark_kernels(args.kernels, args.sizes, args.repeat, args.time_limit)
+    print("\n📈 Exposants de croissance:")
+    for name, result in results.items():
+        exponent = result['exponent']
+        failed = f", échec pour n={', '.join(str(n) for n in result['failed'])}" if result['failed'] else ''
+        print(f"   {name:<42} {'n/a' if exponent is None else f'n^{exponent:.2f}'}{failed}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.plot:
+        plot_curves(results, args.plot)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n⚠️ Régressions:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("\n✅ Aucune régression")
@@ -0,0 +1,71 @@
+import argparse
+import time
+
+import cv2 as cv
+import numpy as np
+
+from detectors.chess_position_detector import ChessPositionDetector
+from utils.corpus import iter_labelled_images
+from utils.fen import square_accuracy
+
+
+def benchmark_mode(mode, samples, repeat=1):
+    """Time one detection mode over labelled images and measure its FEN accuracy"""
+    detector = ChessPositionDetector(mode=mode)
+    times = []
+    exact_matches = 0
+    accuracies = []
+
+    for image, expected_fen in samples:
+        fen = None
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            try:
+                fen = detector.detect(image)
+            except Exception as e:
+                print(f"Erreur ({mode}): {e}")
+                fen = None
+            times.append((time.perf_counter() - start_time) * 1000)
+
+        if fen is None:
+            accuracies.append(0.0)
+            continue
+        accuracies.append(square_accuracy(fen, expected_fen))
+        if fen == expected_fen.split()[0]:
+            exact_matches += 1
+
+    return {
+        'mode': mode,
+        'mean_ms': float(np.mean(times)),
+        'p50_ms': float(np.percentile(times, 50)),
+        'p95_ms': float(np.percentile(times, 95)),
+        'fen_accuracy': exact_matches / len(samples),
+        'square_accuracy': float(np.mean(accuracies)),
+    }
+
+def benchmark_square_classifier(corpus_dir, repeat=1):
+    """Compare the YOLO piece detector with the 64-square classifier"""
+    samples = [(cv.imread(path, cv.IMREAD_COLOR), fen) for path, fen in iter_labelled_images(corpus_dir)]
+    if not samples:
+        print(f"Aucune image annotée trouvée dans {corpus_dir}")
+        return []
+
+    print(f"📂 {len(samples)} images annotées")
+    results = []
+    for mode in (ChessPositionDetector.MODE_PIECES, ChessPositionDetector.MODE_SQUARES):
+        result = benchmark_mode(mode, samples, repeat)
+        results.append(result)
+        print(f"\n📊 Mode {mode}:")
+        print(f"   Temps moyen: {result['mean_ms']:.2f}ms")
+        print(f"   p50 / p95: {result['p50_ms']:.2f}ms / {result['p95_ms']:.2f}ms")
+        print(f"   FEN exactes: {result['fen_accuracy'] * 100:.1f}%")
+        print(f"   Cases correctes: {result['square_accuracy'] * 100:.1f}%")
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare la détection YOLO et la classification des 64 cases")
+    parser.add_argument('corpus', help="Dossier d'images accompagnées de fichiers <nom>.fen")
+    parser.add_argument('--repeat', type=int, default=1, help="Nombre de répétitions par image")
+    args = parser.parse_args()
+    benchmark_square_classifier(args.corpus, args.repeat)
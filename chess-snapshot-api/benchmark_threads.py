@@ -0,0 +1,89 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2 as cv
+
+from utils.corpus import iter_labelled_images
+from utils.other import resize_image
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from thread_budget import ThreadBudget
+
+_detector = None
+
+
+def init_worker(workers, threads, pin_cpus, worker_indices):
+    """Apply the thread budget before the libraries start their pools, then load the detector"""
+    global _detector
+    if threads:
+        budget = ThreadBudget(threads=threads, workers=workers)
+        with worker_indices.get_lock():
+            worker_index = worker_indices.value
+            worker_indices.value += 1
+        budget.apply(worker_index if pin_cpus else None)
+
+    from detectors.chess_position_detector import ChessPositionDetector
+    _detector = ChessPositionDetector()
+    _detector.warmup()
+
+def detect_position(image):
+    _detector.detect(image)
+    return _detector.timings.get('total', 0)
+
+def run_configuration(images, workers, threads, pin_cpus=False):
+    """Throughput of workers processes with threads threads each (0 keeps the library defaults)"""
+    context = multiprocessing.get_context('spawn')
+    worker_indices = context.Value('i', 0)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                             initargs=(workers, threads, pin_cpus, worker_indices)) as executor:
+        # Start and warm up every worker before timing
+        list(executor.map(detect_position, images[:workers]))
+
+        start_time = time.perf_counter()
+        latencies = list(executor.map(detect_position, images))
+        elapsed = time.perf_counter() - start_time
+
+    return {
+        'workers': workers,
+        'threads': threads,
+        'images_per_second': len(images) / elapsed,
+        'mean_latency_ms': sum(latencies) / len(latencies),
+    }
+
+def parse_configuration(value):
+    workers, threads = value.lower().split('x')
+    return int(workers), int(threads)
+
+def benchmark_threads(corpus_dir, configurations, repeat=1, pin_cpus=False):
+    """Compare detection throughput for several workers x threads splits of the CPUs"""
+    images = [resize_image(cv.imread(path, cv.IMREAD_COLOR)) for path, _ in iter_labelled_images(corpus_dir)]
+    if not images:
+        print(f"Aucune image annotée trouvée dans {corpus_dir}")
+        return []
+    images = images * repeat
+
+    print(f"📂 {len(images)} images, {os.cpu_count()} CPU")
+    results = []
+    for workers, threads in configurations:
+        result = run_configuration(images, workers, threads, pin_cpus)
+        results.append(result)
+        label = f"{threads} thread(s)" if threads else "threads par défaut"
+        print(f"   {workers} worker(s) x {label}: {result['images_per_second']:.2f} images/s, "
+              f"latence moyenne {result['mean_latency_ms']:.1f}ms")
+    return results
+
+if __name__ == '__main__':
+    cpu_count = os.cpu_count() or 1
+    default_configurations = [f'{cpu_count}x0', f'{cpu_count}x1', f'{max(1, cpu_count // 2)}x2', f'1x{cpu_count}']
+
+    parser = argparse.ArgumentParser(description="Mesure l'effet du budget de threads sur le débit de détection")
+    parser.add_argument('corpus', help="Dossier d'images accompagnées de fichiers <nom>.fen")
+    parser.add_argument('--configurations', nargs='+', default=default_configurations,
+                        help="Répartitions WORKERSxTHREADS à comparer, 0 thread gardant les valeurs par défaut des bibliothèques")
+    parser.add_argument('--repeat', type=int, default=1, help="Nombre de passages sur le corpus")
+    parser.add_argument('--pin-cpus', action='store_true', help="Attache chaque worker à ses propres CPU")
+    args = parser.parse_args()
+    benchmark_threads(args.corpus, [parse_configuration(value) for value in args.configurations], args.repeat, args.pin_cpus)
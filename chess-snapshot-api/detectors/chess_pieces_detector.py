@@ -1,17 +1,47 @@
+import numpy as np
 from ultralytics import YOLO
+from ultralytics.engine.results import Results
+from ultralytics.models.yolo.detect import DetectionPredictor
+from ultralytics.utils import ops
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from gpu_config import GPUConfig
+from utils.instrumentation import count, stage
+
+
+class MultiLabelDetectionPredictor(DetectionPredictor):
+    """Detection predictor keeping every class above the confidence threshold for each box"""
+
+    def postprocess(self, preds, img, orig_imgs):
+        preds = ops.non_max_suppression(preds, self.args.conf, self.args.iou, agnostic=self.args.agnostic_nms,
+                                        max_det=self.args.max_det, classes=self.args.classes, multi_label=True)
+
+        if not isinstance(orig_imgs, list):
+            orig_imgs = ops.convert_torch2numpy_batch(orig_imgs)
+
+        results = []
+        for i, pred in enumerate(preds):
+            orig_img = orig_imgs[i]
+            pred[:, :4] = ops.scale_boxes(img.shape[2:], pred[:, :4], orig_img.shape)
+            results.append(Results(orig_img, path=self.batch[0][i], names=self.model.names, boxes=pred))
+        return results
 
 
 class ChessPiecesDetector:
     MODEL_PATH = 'models/chess_pieces.model.pt'
+    PIECE_CONFIDENCE = 0.25
+    CANDIDATE_CONFIDENCE = 0.05
 
-    def __init__(self, model_path=MODEL_PATH):
+    def __init__(self, model_path=MODEL_PATH, half=False):
+        if not os.path.exists(model_path):
+            # YOLO would otherwise try to download an unknown model name
+            raise FileNotFoundError(f"Modèle YOLO de détection des pièces introuvable: {model_path}")
         self.gpu_config = GPUConfig()
         self.gpu_config.configure_ultralytics_gpu()
-        
+        # Ultralytics only runs FP16 on CUDA devices
+        self.half = half and self.gpu_config.cuda_available
+
         self.model = YOLO(model_path)
         if self.gpu_config.cuda_available:
             self.model.to(self.gpu_config.device)
@@ -19,12 +49,36 @@ class ChessPiecesDetector:
         else:
             print("⚠️ Modèle YOLO chargé sur CPU")
 
+        self.candidates_predictor = MultiLabelDetectionPredictor(overrides={
+            'conf': self.CANDIDATE_CONFIDENCE,
+            'device': self.gpu_config.device,
+            'half': self.half,
+            'verbose': False,
+            'save': False,
+        })
+
     def detect(self, image):
-        results = self.model(image, verbose=False, device=self.gpu_config.device)
+        results = self.model(image, verbose=False, device=self.gpu_config.device, half=self.half)
         return results
 
-    def detect_piece_class(self, piece_image):
-        piece_results = self.model.predict(piece_image, verbose=False, device=self.gpu_config.device)
-        for piece_box in piece_results[0].boxes:
-            return piece_box.cls
-        return None
+    def detect_candidates(self, image):
+        """Detect pieces keeping per-box class scores, returning a list of (xyxy, scores) per image"""
+        if self.candidates_predictor.model is None:
+            self.candidates_predictor.setup_model(model=self.model.model, verbose=False)
+
+        with stage('yolo'):
+            results = self.candidates_predictor(source=image)
+
+        candidates = []
+        for result in results:
+            boxes = {}
+            for x1, y1, x2, y2, conf, cls in result.boxes.data.cpu().numpy():
+                key = (round(float(x1), 1), round(float(y1), 1), round(float(x2), 1), round(float(y2), 1))
+                if key not in boxes:
+                    boxes[key] = np.zeros(len(result.names), dtype=np.float32)
+                boxes[key][int(cls)] = max(boxes[key][int(cls)], conf)
+
+            candidates.append([(np.array(key), scores) for key, scores in boxes.items()
+                               if scores.max() >= self.PIECE_CONFIDENCE])
+            count('boxes', len(candidates[-1]))
+        return candidates
@@ -1,84 +1,429 @@
-from detectors.chess_pieces_detector import ChessPiecesDetector
+import contextvars
+import itertools
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+
 from detectors.chessboard_detector import ChessboardDetector
-from utils.other import resize_image
+from utils.drawing import draw_checkerboard
+from utils.fen import PIECE_CLASSES, assign_squares, board_confidence, board_to_fen
+from utils.frame_context import FrameContext
+from utils import instrumentation, memory, profiling
+from utils.intersections_detector import IntersectionsDetector
+from utils.lines_detector import LinesDetector
+from utils.other import median_distance, overlap_ratio, reading_order, split_squares
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from thread_budget import ThreadBudget
 
 
 class ChessPositionDetector:
-    def __init__(self):
+    MODE_PIECES = 'pieces'
+    MODE_SQUARES = 'squares'
+    SQUARE_PADDING = 0.25
+    # Upper bound of the shared executor threads, lowered to the thread budget of the process
+    EXECUTOR_WORKERS = 4
+    # Pyramid level in pixels where the board is located first, 0 to locate it on the whole frame
+    COARSE_SIZE = int(os.environ.get('CHESS_COARSE_SIZE', '0')) or None
+    COARSE_MARGIN = 0.15
+    BATCH_SIZE = 16
+    # A board has 49 inner corners, some of them hidden by pieces
+    MIN_BOARD_POINTS = 16
+    # Margin around the inner corners of a board, in median point distances of about 1.2 squares:
+    # its outer ranks and files, plus its border
+    REGION_MARGIN = 1.5
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, mode=MODE_PIECES, square_padding=SQUARE_PADDING, executor=None,
+                 max_size=FrameContext.MAX_SIZE, coarse_size=COARSE_SIZE, low_memory=memory.LOW_MEMORY,
+                 idle_timeout=memory.MODEL_IDLE_TIMEOUT):
+        if mode not in (self.MODE_PIECES, self.MODE_SQUARES):
+            raise ValueError(f'Unknown detection mode: {mode}')
+
+        self.mode = mode
+        self.square_padding = square_padding
+        self.max_size = max_size
+        self.coarse_size = coarse_size
+        self.low_memory = low_memory
+        self.executor = executor or self.shared_executor()
+        self.timings = {}
+        self.confidence = None
         self.chessboard_detector = ChessboardDetector()
-        self.chess_pieces_detector = ChessPiecesDetector()
+        self.chess_pieces_detector = None
+        self.chess_squares_classifier = None
+        self.load_models()
+        self.idle_unloader = memory.IdleUnloader(idle_timeout, self.unload_models, loaded=True) if idle_timeout else None
+
+    def load_models(self):
+        """Load the piece model of the mode, in FP16 on CUDA devices in low memory mode"""
+        if self.mode == self.MODE_PIECES:
+            from detectors.chess_pieces_detector import ChessPiecesDetector
+            self.chess_pieces_detector = ChessPiecesDetector(half=self.low_memory)
+        else:
+            from detectors.chess_squares_classifier import ChessSquaresClassifier
+            self.chess_squares_classifier = ChessSquaresClassifier(half=self.low_memory)
+
+    def unload_models(self):
+        """Drop the piece and lattice points models, the next detection loads them again"""
+        self.chess_pieces_detector = None
+        self.chess_squares_classifier = None
+        IntersectionsDetector.unload_model()
+
+    def models_in_use(self):
+        """Context manager keeping the models loaded during a detection, reloading them after an idle unload"""
+        if self.idle_unloader is None:
+            return nullcontext()
+        return self.idle_unloader.use(self.load_models)
+
+    @classmethod
+    def shared_executor(cls):
+        """Thread pool shared by all detectors to run independent stages concurrently"""
+        with cls._executor_lock:
+            if cls._executor is None:
+                budget = ThreadBudget.applied or ThreadBudget()
+                cls._executor = ThreadPoolExecutor(max_workers=max(1, min(cls.EXECUTOR_WORKERS, budget.threads)),
+                                                   thread_name_prefix='chess-position')
+            return cls._executor
+
+    def reset_executor(self):
+        """Use a new shared executor in a forked child, where the threads of the parent's pool do not exist"""
+        with self._executor_lock:
+            ChessPositionDetector._executor = None
+        self.executor = self.shared_executor()
+
+    def timed(self, stage, function, *args):
+        """Run function and record its duration in milliseconds under stage, and in the instrumentation
+
+        In a profiled request, stages run on the executor are profiled as well.
+        """
+        start_time = time.perf_counter()
+        with instrumentation.stage(stage), profiling.thread_profile():
+            result = function(*args)
+        self.timings[stage] = (time.perf_counter() - start_time) * 1000
+        return result
+
+    def warmup(self):
+        """Run the pipeline once on a synthetic board so that every model is loaded and initialized"""
+        IntersectionsDetector.get_model()
+        try:
+            self.detect(draw_checkerboard())
+        except Exception as e:
+            print(f"⚠️ Préchauffage incomplet: {e}")
+        self.timings = {}
 
     def detect(self, image):
-        image = resize_image(image)
-        chessboard_image = self.chessboard_detector.detect(image)
-        chess_pieces_result = self.chess_pieces_detector.detect(image)[0]
+        start_time = time.perf_counter()
+        self.timings = {}
+        self.confidence = None
+        with self.models_in_use():
+            context = FrameContext(image, self.max_size)
+            if self.coarse_size:
+                context = self.timed('coarse', self.crop_board_region, context)
+            context = self.timed('preprocess', context.prepare)
+            if self.mode == self.MODE_SQUARES:
+                fen = self.detect_squares(context)
+            else:
+                fen = self.detect_pieces(context)
+        if self.low_memory:
+            # The detector would otherwise keep the frame and its lines until the next detection
+            self.chessboard_detector.release()
+            memory.release_memory(collect=False)
+        self.timings['total'] = (time.perf_counter() - start_time) * 1000
+        return fen
+
+    def crop_board_region(self, context, chessboard_detector=None):
+        """Locate the board on a small pyramid level and crop its region from the full resolution frame
+
+        The coarse corners are kept on the crop, so that rectification starts from them instead of searching
+        the crop again. Falls back to the whole frame when no board is found at the coarse scale.
+        """
+        chessboard_detector = chessboard_detector or self.chessboard_detector
+        coarse_image = context.scaled(self.coarse_size)
+        try:
+            corners = chessboard_detector.locate(coarse_image)
+        except Exception:
+            corners = None
+        if not corners:
+            return context
+
+        original_height, original_width = context.original_image.shape[:2]
+        scale = original_width / coarse_image.shape[1]
+        xs = [x * scale for x, _ in corners]
+        ys = [y * scale for _, y in corners]
+        margin = self.COARSE_MARGIN * max(max(xs) - min(xs), max(ys) - min(ys))
+
+        x1 = max(0, int(min(xs) - margin))
+        y1 = max(0, int(min(ys) - margin))
+        x2 = min(original_width, int(max(xs) + margin))
+        y2 = min(original_height, int(max(ys) + margin))
+        if x2 <= x1 or y2 <= y1:
+            return context
+
+        crop_context = FrameContext(context.original_image[y1:y2, x1:x2], self.max_size)
+        crop_scale = crop_context.image.shape[1] / (x2 - x1)
+        crop_context.board_corners = [[int((x - x1) * crop_scale), int((y - y1) * crop_scale)]
+                                      for x, y in zip(xs, ys)]
+        return crop_context
+
+    def detect_squares(self, context):
+        """Classify the 64 squares of the rectified board in one batch"""
+        chessboard_image = self.timed('chessboard', self.chessboard_detector.detect, context)
+        square_images = split_squares(chessboard_image, self.square_padding)
+        probabilities = self.timed('squares', self.chess_squares_classifier.classify, square_images)
+
+        square_scores, empty_scores = self.squares_to_scores(probabilities)
+        chessboard = self.timed('assignment', assign_squares, square_scores, empty_scores)
+        self.confidence = board_confidence(chessboard, square_scores, empty_scores)
+
+        return self.timed('fen', board_to_fen, chessboard)
+
+    def detect_pieces(self, context):
+        """Detect pieces with YOLO on the whole image and map them to board squares
+
+        Board localization only needs the preprocessed frame, so it runs on the shared
+        executor while the pieces are detected in the calling thread.
+        """
+        if self.low_memory:
+            # One stage after the other, so that their intermediate images and tensors are never alive together
+            chessboard_image = self.timed('chessboard', self.chessboard_detector.detect, context)
+            candidates = self.timed('pieces', self.chess_pieces_detector.detect_candidates, context.image)[0]
+        else:
+            # The copied context carries the request trace over to the executor thread
+            chessboard_future = self.executor.submit(contextvars.copy_context().run,
+                                                     self.timed, 'chessboard', self.chessboard_detector.detect, context)
+            candidates = self.timed('pieces', self.chess_pieces_detector.detect_candidates, context.image)[0]
+            wait_start_time = time.perf_counter()
+            chessboard_image = chessboard_future.result()
+            self.timings['join'] = (time.perf_counter() - wait_start_time) * 1000
+
+        square_scores = self.pieces_to_scores(candidates, chessboard_image, self.chessboard_detector)
+        chessboard = self.timed('assignment', assign_squares, square_scores)
+        self.confidence = board_confidence(chessboard, square_scores)
 
+        return self.timed('fen', board_to_fen, chessboard)
+
+    @staticmethod
+    def squares_to_scores(probabilities):
+        """Split the 64x13 square probabilities into piece and empty scores per square"""
+        square_scores = {}
+        empty_scores = {}
+        for index, scores in enumerate(probabilities):
+            square_scores[(index // 8, index % 8)] = scores[:len(PIECE_CLASSES)]
+            empty_scores[(index // 8, index % 8)] = scores[len(PIECE_CLASSES)]
+        return square_scores, empty_scores
+
+    @staticmethod
+    def pieces_to_scores(candidates, chessboard_image, chessboard_detector):
+        """Map piece boxes to the squares of the rectified board, keeping the best score per class"""
         image_width = chessboard_image.shape[1]
         image_height = chessboard_image.shape[0]
 
         box_width = image_width / 8
         box_height = image_height / 8
 
-        chess_pieces = ['b', 'k', 'n', 'p', 'q', 'r', 'B', 'K', 'N', 'P', 'Q', 'R']
-        piece_positions = []
-        pieces_count = {
-            'b': 0, 'k': 0, 'n': 0, 'p': 0, 'q': 0, 'r': 0,
-            'B': 0, 'K': 0, 'N': 0, 'P': 0, 'Q': 0, 'R': 0
-        }
-
-        pieces_max_count = {
-            'b': 8, 'k': 1, 'n': 2, 'p': 8, 'q': 1, 'r': 2,
-            'B': 8, 'K': 1, 'N': 2, 'P': 8, 'Q': 1, 'R': 2
-        }
-
-        for box in chess_pieces_result.boxes:
-            piece_type = chess_pieces[int(box.cls)]
-            xmin, ymin, xmax, ymax = box.xyxy[0]
-            piece_image = image[int(ymin):int(ymax), int(xmin):int(xmax)]
-
-            if pieces_count[piece_type] >= pieces_max_count[piece_type]:
-                new_piece_cls = self.chess_pieces_detector.detect_piece_class(piece_image)
-                if new_piece_cls is not None:
-                    piece_type = chess_pieces[int(new_piece_cls)]
-            pieces_count[piece_type] += 1
-
+        square_scores = {}
+        for (xmin, ymin, xmax, ymax), scores in candidates:
             x_middle = (xmin + xmax) / 2
             y_middle = ymax - (box_height / 2)
 
-            transformed_point = self.chessboard_detector.transform_point([[x_middle, y_middle]])
+            transformed_point = chessboard_detector.transform_point([[x_middle, y_middle]])
 
             if transformed_point[0] < 0 or transformed_point[1] < 0:
                 continue
-            if transformed_point[0] > image_width or transformed_point[1] > image_height:
+            if transformed_point[0] >= image_width or transformed_point[1] >= image_height:
                 continue
 
             col = int(transformed_point[0] / box_width)
             row = int(transformed_point[1] / box_height)
-            piece_positions.append((piece_type, (row, col)))
-
-        piece_positions.sort(key=lambda x: (x[1][0], x[1][1]))
-
-        chessboard = [['.' for _ in range(8)] for _ in range(8)]
-
-        for piece_type, (row, col) in piece_positions:
-            chessboard[row][col] = piece_type
-
-        fen_rows = []
-        for row in chessboard:
-            fen_row = ''
-            empty_count = 0
-            for square in row:
-                if square == '.':
-                    empty_count += 1
-                else:
-                    if empty_count > 0:
-                        fen_row += str(empty_count)
-                        empty_count = 0
-                    fen_row += square
-            if empty_count > 0:
-                fen_row += str(empty_count)
-            fen_rows.append(fen_row)
-
-        fen = '/'.join(fen_rows)
-
-        return fen
\ No newline at end of file
+            if (row, col) in square_scores:
+                scores = np.maximum(square_scores[(row, col)], scores)
+            square_scores[(row, col)] = scores
+
+        return square_scores
+
+    def locate_board(self, image, coarse=True):
+        """Preprocess one frame and rectify its board with a dedicated ChessboardDetector"""
+        chessboard_detector = ChessboardDetector()
+        context = FrameContext(image, self.max_size)
+        if coarse and self.coarse_size:
+            context = self.crop_board_region(context, chessboard_detector)
+        chessboard_image = chessboard_detector.detect(context.prepare())
+        if self.low_memory:
+            chessboard_detector.release()
+        return context, chessboard_detector, chessboard_image
+
+    def detect_batch(self, images, batch_size=BATCH_SIZE):
+        """Detect the positions of several images, returning a FEN or an exception per image in input order
+
+        Boards are located concurrently on the shared executor, then the piece model
+        runs over all located boards in batches of batch_size images.
+        """
+        start_time = time.perf_counter()
+        self.timings = {}
+        results = [None] * len(images)
+
+        with self.models_in_use():
+            board_start_time = time.perf_counter()
+            futures = [self.executor.submit(contextvars.copy_context().run, self.locate_board, image)
+                       for image in images]
+            boards = {}
+            for index, future in enumerate(futures):
+                try:
+                    boards[index] = future.result()
+                except Exception as e:
+                    results[index] = e
+            self.timings['chessboard'] = (time.perf_counter() - board_start_time) * 1000
+
+            indices = list(boards)
+            for batch_start in range(0, len(indices), batch_size):
+                batch = indices[batch_start:batch_start + batch_size]
+                try:
+                    batch_scores = self.score_batch(batch, boards)
+                except Exception as e:
+                    for index in batch:
+                        results[index] = e
+                    continue
+
+                assignment_start_time = time.perf_counter()
+                for index, scores in zip(batch, batch_scores):
+                    results[index] = board_to_fen(assign_squares(*scores))
+                    if self.low_memory:
+                        del boards[index]
+                self.timings['assignment'] = self.timings.get('assignment', 0) + \
+                    (time.perf_counter() - assignment_start_time) * 1000
+
+        if self.low_memory:
+            memory.release_memory(collect=False)
+        self.timings['total'] = (time.perf_counter() - start_time) * 1000
+        return results
+
+    def find_board_regions(self, context, min_points=MIN_BOARD_POINTS):
+        """Boxes (x1, y1, x2, y2) of the original image around each board of a page, in reading order
+
+        Lines and lattice points are found once on the whole page, then split into one
+        group of points per board.
+        """
+        lines = LinesDetector.detect(context.gray)
+        groups = IntersectionsDetector.detect_groups(context.gray, lines, min_points)
+
+        original_height, original_width = context.original_image.shape[:2]
+        scale = original_width / context.image.shape[1]
+        regions = []
+        for points in groups:
+            xs = [x for x, _ in points]
+            ys = [y for _, y in points]
+            margin = self.REGION_MARGIN * median_distance(points)
+            regions.append((max(0, int((min(xs) - margin) * scale)), max(0, int((min(ys) - margin) * scale)),
+                            min(original_width, int((max(xs) + margin) * scale)),
+                            min(original_height, int((max(ys) + margin) * scale))))
+
+        # A board split into several groups gives overlapping regions, and a merged
+        # region can overlap others in turn, so merge until no pair overlaps
+        merged = True
+        while merged:
+            merged = False
+            for i, j in itertools.combinations(range(len(regions)), 2):
+                if overlap_ratio(regions[i], regions[j]) > 0.25:
+                    a, b = regions[i], regions.pop(j)
+                    regions[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    merged = True
+                    break
+        return reading_order(regions)
+
+    @staticmethod
+    def region_error(region, error):
+        """Result of a page region whose detection failed"""
+        return {'box': list(region), 'error': f"{type(error).__name__}: {error}"}
+
+    def detect_all(self, image, page_size=None):
+        """Detect the positions of every board of a page holding several diagrams
+
+        Board regions are found in one pass over the page, each region is rectified on
+        the shared executor, then the piece model runs over all boards in batches.
+        Returns a dict per board with its fen, confidence, box (x1, y1, x2, y2) and
+        corners in the image, in reading order. Regions where no board is found are
+        left out; a region whose detection failed gives its box and an error instead.
+        """
+        start_time = time.perf_counter()
+        self.timings = {}
+        self.confidence = None
+        with self.models_in_use():
+            page = FrameContext(image, page_size or self.max_size)
+            regions = self.timed('regions', self.find_board_regions, page.prepare())
+
+            board_start_time = time.perf_counter()
+            futures = [self.executor.submit(contextvars.copy_context().run, self.locate_board,
+                                            page.original_image[y1:y2, x1:x2], False)
+                       for x1, y1, x2, y2 in regions]
+            boards = {}
+            results = {}
+            for index, future in enumerate(futures):
+                try:
+                    board = future.result()
+                except Exception as e:
+                    results[index] = self.region_error(regions[index], e)
+                    continue
+                # Regions whose rectification found no board are false positives of the page pass
+                if board[1].transform_matrices:
+                    boards[index] = board
+            self.timings['chessboard'] = (time.perf_counter() - board_start_time) * 1000
+
+            indices = list(boards)
+            for batch_start in range(0, len(indices), self.BATCH_SIZE):
+                batch = indices[batch_start:batch_start + self.BATCH_SIZE]
+                try:
+                    batch_scores = self.score_batch(batch, boards)
+                except Exception as e:
+                    for index in batch:
+                        results[index] = self.region_error(regions[index], e)
+                    continue
+
+                assignment_start_time = time.perf_counter()
+                for index, scores in zip(batch, batch_scores):
+                    context, chessboard_detector, _ = boards[index]
+                    chessboard = assign_squares(*scores)
+                    x1, y1, x2, y2 = regions[index]
+                    # Board corners in the resized region, back to the original image
+                    corners = chessboard_detector.board_corners() * ((x2 - x1) / context.image.shape[1]) + (x1, y1)
+                    results[index] = {
+                        'fen': board_to_fen(chessboard),
+                        'confidence': board_confidence(chessboard, *scores),
+                        'box': [int(corners[:, 0].min()), int(corners[:, 1].min()),
+                                int(np.ceil(corners[:, 0].max())), int(np.ceil(corners[:, 1].max()))],
+                        'corners': corners.round(1).tolist(),
+                    }
+                    if self.low_memory:
+                        del boards[index]
+                self.timings['assignment'] = self.timings.get('assignment', 0) + \
+                    (time.perf_counter() - assignment_start_time) * 1000
+
+        if self.low_memory:
+            memory.release_memory(collect=False)
+        self.timings['total'] = (time.perf_counter() - start_time) * 1000
+        return [results[index] for index in sorted(results)]
+
+    def score_batch(self, batch, boards):
+        """Run the piece model once over a batch of located boards, returning (square_scores, empty_scores) per board"""
+        batch_start_time = time.perf_counter()
+        if self.mode == self.MODE_SQUARES:
+            stage = 'squares'
+            square_images = []
+            for index in batch:
+                square_images += split_squares(boards[index][2], self.square_padding)
+            probabilities = self.chess_squares_classifier.classify(square_images)
+            batch_scores = [self.squares_to_scores(probabilities[i * 64:(i + 1) * 64]) for i in range(len(batch))]
+        else:
+            stage = 'pieces'
+            candidates = self.chess_pieces_detector.detect_candidates([boards[index][0].image for index in batch])
+            batch_scores = []
+            for index, image_candidates in zip(batch, candidates):
+                _, chessboard_detector, chessboard_image = boards[index]
+                batch_scores.append((self.pieces_to_scores(image_candidates, chessboard_image, chessboard_detector), None))
+        self.timings[stage] = self.timings.get(stage, 0) + (time.perf_counter() - batch_start_time) * 1000
+        return batch_scores
@@ -0,0 +1,50 @@
+import numpy as np
+from ultralytics import YOLO
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from gpu_config import GPUConfig
+from utils.fen import EMPTY_SQUARE, SQUARE_CLASSES
+from utils.instrumentation import count, stage
+
+
+class ChessSquaresClassifier:
+    MODEL_PATH = 'models/chess_squares.model.pt'
+    IMAGE_SIZE = 64
+    EMPTY_CLASS_NAME = 'empty'
+
+    def __init__(self, model_path=MODEL_PATH, image_size=IMAGE_SIZE, half=False):
+        if not os.path.exists(model_path):
+            # YOLO would otherwise try to download an unknown model name
+            raise FileNotFoundError(f"Modèle de classification des cases introuvable: {model_path}. "
+                                    f"Générez-le avec: python train_square_classifier.py --output {model_path}")
+        self.gpu_config = GPUConfig()
+        self.gpu_config.configure_ultralytics_gpu()
+        # Ultralytics only runs FP16 on CUDA devices
+        self.half = half and self.gpu_config.cuda_available
+
+        self.image_size = image_size
+        self.model = YOLO(model_path, task='classify')
+        if self.gpu_config.cuda_available:
+            self.model.to(self.gpu_config.device)
+            print(f"✅ Modèle de classification des cases chargé sur {self.gpu_config.device}")
+        else:
+            print("⚠️ Modèle de classification des cases chargé sur CPU")
+
+        # Column of the model output for each entry of SQUARE_CLASSES
+        self.class_indices = np.zeros(len(SQUARE_CLASSES), dtype=np.int64)
+        for index, name in self.model.names.items():
+            square_class = EMPTY_SQUARE if name == self.EMPTY_CLASS_NAME else name
+            self.class_indices[SQUARE_CLASSES.index(square_class)] = index
+
+    def classify(self, square_images):
+        """Classify square crops in one batch, returning an (n, 13) array ordered as SQUARE_CLASSES"""
+        if len(square_images) == 0:
+            return np.zeros((0, len(SQUARE_CLASSES)), dtype=np.float32)
+
+        with stage('square_classifier'):
+            results = self.model(square_images, imgsz=self.image_size, verbose=False, device=self.gpu_config.device,
+                                 half=self.half)
+            probabilities = np.stack([result.probs.data.cpu().numpy() for result in results])
+        count('squares', len(square_images))
+        return probabilities[:, self.class_indices]
@@ -1,8 +1,13 @@
+import cv2 as cv
+import numpy as np
+
 from utils.drawing import draw_lines, draw_points
+from utils.frame_context import FrameContext
+from utils.instrumentation import stage
 from utils.intersections_detector import IntersectionsDetector
 from utils.lines_detector import LinesDetector
 from utils.llr import LLR, llr_pad
-from utils.other import resize_image, order_corners, bound_corners, perspective_transform, point_transform
+from utils.other import order_corners, bound_corners, perspective_transform, point_transform
 
 
 class ChessboardDetector:
@@ -11,14 +16,18 @@ class ChessboardDetector:
     def __init__(self):
         self.original_image = None
         self.image = None
+        self.gray = None
         self.intersections = []
         self.lines = []
         self.corners = []
         self.transform_matrices = []
 
     def set_image(self, image):
-        self.original_image = image.copy()
-        self.image = resize_image(image)
+        """Use a FrameContext, or an image wrapped in a new one, without copying it"""
+        context = image if isinstance(image, FrameContext) else FrameContext(image)
+        self.original_image = context.original_image
+        self.image = context.image
+        self.gray = context.gray
         self.intersections = []
         self.lines = []
         self.corners = []
@@ -26,25 +35,59 @@ class ChessboardDetector:
         return self.image
 
     def detect_lines(self):
-        self.lines = LinesDetector.detect(self.image)
+        self.lines = LinesDetector.detect(self.gray)
         return self.lines
 
     def detect_intersections(self):
-        self.intersections = IntersectionsDetector.detect(self.image, self.lines)
+        self.intersections = IntersectionsDetector.detect(self.gray, self.lines)
         return self.intersections
 
     def detect_corners(self):
-        self.corners = LLR(self.image, self.intersections, self.lines)
-        self.corners = llr_pad(self.corners)
+        with stage('llr'):
+            self.corners = LLR(self.image, self.intersections, self.lines)
+        return self.use_corners(self.corners)
+
+    def use_corners(self, corners):
+        """Pad, bound and order the corners of the board found in the current image"""
+        self.corners = llr_pad(corners)
         self.corners = bound_corners(self.corners, self.image.shape[1], self.image.shape[0])
         self.corners = order_corners(self.corners)
         return self.corners
 
+    def locate(self, image):
+        """Find the board corners in a single pass, without padding, or None when there is no board"""
+        self.set_image(image)
+        self.detect_lines()
+        self.detect_intersections()
+        if len(self.intersections) < 4:
+            return None
+        return LLR(self.image, self.intersections, self.lines)
+
     def transform(self):
-        self.image, transform_matrix = perspective_transform(self.image, self.corners)
+        with stage('warp'):
+            self.image, transform_matrix = perspective_transform(self.image, self.corners)
+            self.gray = cv.cvtColor(self.image, cv.COLOR_BGR2GRAY) if len(self.image.shape) == 3 else self.image
         self.transform_matrices.append(transform_matrix)
         return self.image
 
+    def release(self):
+        """Drop the input images, lines and intersections, keeping what transform_point needs"""
+        self.original_image = None
+        self.gray = None
+        self.lines = []
+        self.intersections = []
+
+    def board_corners(self):
+        """Top left, top right, bottom right and bottom left corners of the rectified board in the input image,
+        or None when no board was found"""
+        if not self.transform_matrices:
+            return None
+        height, width = self.image.shape[:2]
+        points = np.array([[[0, 0], [width, 0], [width, height], [0, height]]], dtype=np.float32)
+        for transform_matrix in reversed(self.transform_matrices):
+            points = cv.perspectiveTransform(points, np.linalg.inv(transform_matrix))
+        return points[0]
+
     def transform_point(self, point):
         return point_transform(point, self.transform_matrices)
 
@@ -66,6 +109,12 @@ class ChessboardDetector:
 
     def detect(self, image, layer_count=LAYER_COUNT):
         self.set_image(image)
+        corners = image.board_corners if isinstance(image, FrameContext) else None
+        if corners is not None and layer_count > 0:
+            # The first layer starts from the corners of a coarse pass instead of searching the whole frame
+            self.use_corners(corners)
+            self.transform()
+            layer_count -= 1
         for _ in range(layer_count):
             self.layer()
         return self.image
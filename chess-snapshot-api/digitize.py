@@ -0,0 +1,249 @@
+"""
+Batch digitization of board images over a pool of worker processes.
+
+Inputs are directories (searched recursively), glob patterns, image files, and
+zip or tar archives, possibly compressed. Images are read one at a time as
+workers become free, so inputs of any size run in bounded memory, and each
+worker loads the models once. Results are written as NDJSON or CSV as soon as
+each image is done, so they come out of input order; every record carries the
+image path, or <archive>:<member> for archived images. With --multi-board, each
+page can hold several diagrams and its record lists all of them. With --resume,
+images already present in the output file are skipped and new results are appended.
+
+    python digitize.py scans/ more/*.png diagrams.zip --output positions.ndjson --workers 8
+    python digitize.py library.tar.gz --output positions.csv --resume
+    python digitize.py pages/ --output boards.ndjson --multi-board
+"""
+
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.corpus import IMAGE_EXTENSIONS
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+CSV_FIELDS = ('image', 'board', 'fen', 'confidence', 'box', 'ms', 'error')
+PROGRESS_INTERVAL = 100
+
+_detector = None
+_archives = {}
+
+
+def is_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+def iter_inputs(inputs, done):
+    """Yield (key, source) for the images of the inputs not in done, listing and reading them lazily
+
+    source is ('file', path), ('zip', archive, member), both read by the worker, or
+    ('bytes', data) for tar members, which can only be read in order. Yielded keys
+    are added to done, so that an image matched by several inputs is only yielded once.
+    """
+    for key, source in iter_sources(inputs, done):
+        if key not in done:
+            done.add(key)
+            yield key, source
+
+def iter_sources(inputs, done):
+    for spec in inputs:
+        if os.path.isdir(spec):
+            for directory, subdirectories, filenames in os.walk(spec):
+                subdirectories.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(directory, filename)
+                    if is_image(filename) and path not in done:
+                        yield path, ('file', path)
+        elif os.path.isfile(spec) and is_image(spec):
+            if spec not in done:
+                yield spec, ('file', spec)
+        elif os.path.isfile(spec) and zipfile.is_zipfile(spec):
+            with zipfile.ZipFile(spec) as archive:
+                for info in archive.infolist():
+                    key = f'{spec}:{info.filename}'
+                    if not info.is_dir() and is_image(info.filename) and key not in done:
+                        yield key, ('zip', spec, info.filename)
+        elif os.path.isfile(spec) and tarfile.is_tarfile(spec):
+            with tarfile.open(spec, 'r|*') as archive:
+                for member in archive:
+                    key = f'{spec}:{member.name}'
+                    if member.isfile() and is_image(member.name) and key not in done:
+                        yield key, ('bytes', archive.extractfile(member).read())
+        elif not os.path.exists(spec):
+            paths = glob.glob(spec, recursive=True)
+            if not paths:
+                print(f"⚠️ Aucune image pour {spec}", file=sys.stderr)
+            yield from iter_sources(sorted(paths), done)
+
+def init_worker(mode, workers):
+    """Load the detector once per worker process, with its share of the CPUs"""
+    global _detector
+    from detectors.chess_position_detector import ChessPositionDetector
+    from thread_budget import ThreadBudget
+
+    ThreadBudget(workers=workers).apply()
+    _detector = ChessPositionDetector(mode=mode)
+
+def read_source(source):
+    if source[0] == 'file':
+        with open(source[1], 'rb') as f:
+            return f.read()
+    if source[0] == 'zip':
+        # Each worker keeps its own handle on the archives it reads from
+        archive = _archives.get(source[1])
+        if archive is None:
+            archive = _archives[source[1]] = zipfile.ZipFile(source[1])
+        return archive.read(source[2])
+    return source[1]
+
+def digitize_one(key, source, multi_board=False):
+    """Detect the position of one image, or with multi_board of all the boards of a page, in a worker process"""
+    from utils.frame_context import FrameContext
+    from utils.image_io import decode_image
+
+    start_time = time.perf_counter()
+    try:
+        # The boards of a page are cropped from the full resolution image
+        image = decode_image(read_source(source), None if multi_board else FrameContext.MAX_SIZE)
+        if image is None:
+            return {'image': key, 'error': 'Invalid image'}
+        if multi_board:
+            boards = _detector.detect_all(image)
+        else:
+            fen = _detector.detect(image)
+    except Exception as e:
+        return {'image': key, 'error': f"{type(e).__name__}: {e}"}
+    if multi_board:
+        boards = [{**board, 'confidence': float(board['confidence'])} if 'confidence' in board else board
+                  for board in boards]
+        return {'image': key, 'boards': boards, 'ms': (time.perf_counter() - start_time) * 1000}
+    confidence = _detector.confidence
+    return {
+        'image': key,
+        'fen': fen,
+        'confidence': float(confidence) if confidence is not None else None,
+        'ms': (time.perf_counter() - start_time) * 1000,
+    }
+
+def read_done(output_path, output_format, retry_errors=False):
+    """Keys of the images already in the output file, without the failed ones when retry_errors"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8', newline='') as f:
+        if output_format == 'csv':
+            records = csv.DictReader(f)
+        else:
+            records = []
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Partial last line of an interrupted run
+                    continue
+        for record in records:
+            if record.get('image') and not (retry_errors and record.get('error')):
+                done.add(record['image'])
+    return done
+
+def csv_rows(record):
+    """CSV rows of a record, one per board for a page, one without board when no board was found on it"""
+    if 'boards' not in record:
+        return [record]
+    rows = [{'image': record['image'], 'board': index, 'fen': board.get('fen'), 'confidence': board.get('confidence'),
+             'box': ' '.join(str(value) for value in board['box']), 'ms': record['ms'], 'error': board.get('error')}
+            for index, board in enumerate(record['boards'])]
+    return rows or [{'image': record['image'], 'ms': record['ms']}]
+
+def open_output(output_path, output_format, append):
+    """Output file and a function writing one record to it"""
+    new_file = not append or not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    output = open(output_path, 'a' if append else 'w', encoding='utf-8', newline='')
+    if output_format == 'csv':
+        writer = csv.DictWriter(output, CSV_FIELDS)
+        if new_file:
+            writer.writeheader()
+        return output, lambda record: writer.writerows(csv_rows(record))
+    return output, lambda record: output.write(json.dumps(record) + '\n')
+
+def digitize(inputs, output_path, output_format='ndjson', workers=None, mode='pieces', resume=False,
+             retry_errors=False, multi_board=False):
+    """Detect the position of every image of the inputs, writing one record per image to output_path"""
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    done = read_done(output_path, output_format, retry_errors) if resume else set()
+    if done:
+        print(f"↩️ Reprise: {len(done)} images déjà traitées", file=sys.stderr)
+
+    images = iter_inputs(inputs, done)
+    count = 0
+    failures = 0
+    start_time = time.perf_counter()
+
+    # TensorFlow and PyTorch do not survive a fork once initialized
+    context = multiprocessing.get_context('spawn')
+    output, write = open_output(output_path, output_format, resume)
+    with output, ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                     initargs=(mode, workers)) as executor:
+        print(f"🖼️ {workers} worker(s), mode {mode}", file=sys.stderr)
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            # Keep every worker busy without reading the whole input in memory
+            while not exhausted and len(pending) < 2 * workers:
+                try:
+                    key, source = next(images)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(digitize_one, key, source, multi_board)] = key
+
+            if not pending:
+                break
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                key = pending.pop(future)
+                try:
+                    record = future.result()
+                except BrokenProcessPool:
+                    # A worker died, most likely killed for lack of memory: what is written is kept for --resume
+                    output.flush()
+                    print(f"❌ Un worker s'est arrêté pendant {key}, relancer avec --resume", file=sys.stderr)
+                    raise
+                write(record)
+                count += 1
+                failures += 'error' in record
+                if count % PROGRESS_INTERVAL == 0:
+                    elapsed = time.perf_counter() - start_time
+                    print(f"   {count} images, {count / elapsed:.1f} images/s", file=sys.stderr)
+            output.flush()
+
+    elapsed = time.perf_counter() - start_time
+    print(f"✅ {count} images traitées en {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} images/s), "
+          f"{failures} échec(s)", file=sys.stderr)
+    return count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Détecte la position de lots d'images avec un pool de processus")
+    parser.add_argument('inputs', nargs='+', help="Dossiers, motifs glob, images ou archives zip/tar")
+    parser.add_argument('--output', required=True, help="Fichier de résultats NDJSON ou CSV")
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default=None,
+                        help="Format de sortie, déduit de l'extension de --output par défaut")
+    parser.add_argument('--workers', type=int, default=None, help="Nombre de processus, la moitié des CPU par défaut")
+    parser.add_argument('--mode', choices=('pieces', 'squares'), default='pieces', help="Mode de détection")
+    parser.add_argument('--multi-board', action='store_true',
+                        help="Détecte tous les diagrammes de chaque page, avec leur boîte englobante")
+    parser.add_argument('--resume', action='store_true', help="Ignore les images déjà présentes dans --output et y ajoute les autres")
+    parser.add_argument('--retry-errors', action='store_true', help="Avec --resume, traite à nouveau les images en échec")
+    args = parser.parse_args()
+
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'ndjson')
+    digitize(args.inputs, args.output, output_format, args.workers, args.mode, args.resume, args.retry_errors,
+             args.multi_board)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Stand-in UCI engine for load tests, answering like Stockfish without searching.
+
+Each depth iteration takes FAKE_ENGINE_DEPTH_DELAY seconds (0.01 by default),
+plus up to FAKE_ENGINE_JITTER seconds at random, and reports a legal principal
+variation. Point the API at it with:
+
+    STOCKFISH_PATH=./fake_engine.py python app.py
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+import chess
+
+DEPTH_DELAY = float(os.environ.get('FAKE_ENGINE_DEPTH_DELAY', '0.01'))
+JITTER = float(os.environ.get('FAKE_ENGINE_JITTER', '0'))
+NODES_PER_SECOND = 1000000
+MAX_DEPTH = 245
+
+
+def send(line):
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+def principal_variation(board, length):
+    """A legal line of up to length moves, chosen deterministically from the position"""
+    board = board.copy(stack=False)
+    rng = random.Random(board.fen())
+    moves = []
+    for _ in range(length):
+        legal_moves = list(board.legal_moves)
+        if not legal_moves:
+            break
+        move = rng.choice(legal_moves)
+        moves.append(move)
+        board.push(move)
+    return moves
+
+def parse_go(arguments):
+    """Depth and time limit in seconds of a go command"""
+    depth, movetime = None, None
+    for name, value in zip(arguments, arguments[1:]):
+        if name == 'depth':
+            depth = int(value)
+        elif name == 'movetime':
+            movetime = int(value) / 1000
+    if depth is None and movetime is None and 'infinite' not in arguments:
+        depth = 10
+    return depth, movetime
+
+def search(board, depth, movetime, multipv, stop_event):
+    start_time = time.perf_counter()
+    score = random.Random(board.epd()).randint(-80, 80)
+    best_move = None
+    current_depth = 0
+    while not stop_event.is_set() and current_depth < (depth or MAX_DEPTH):
+        delay = DEPTH_DELAY + random.uniform(0, JITTER)
+        if movetime is not None:
+            delay = min(delay, max(0.0, movetime - (time.perf_counter() - start_time)))
+        if stop_event.wait(delay):
+            break
+        current_depth += 1
+        elapsed = max(time.perf_counter() - start_time, 1e-6)
+        nodes = int(elapsed * NODES_PER_SECOND)
+        pv = principal_variation(board, min(current_depth, 8))
+        if not pv:
+            break
+        best_move = pv[0]
+        for index in range(1, multipv + 1):
+            send(f'info depth {current_depth} seldepth {current_depth + 2} multipv {index} score cp {score - 10 * (index - 1)} '
+                 f'nodes {nodes} nps {NODES_PER_SECOND} time {int(elapsed * 1000)} pv {" ".join(m.uci() for m in pv)}')
+        if movetime is not None and time.perf_counter() - start_time >= movetime:
+            break
+
+    if best_move is None:
+        legal_moves = list(board.legal_moves)
+        if not legal_moves:
+            send('info depth 0 score mate 0' if board.is_checkmate() else 'info depth 0 score cp 0')
+            send('bestmove (none)')
+            return
+        best_move = legal_moves[0]
+    send(f'bestmove {best_move.uci()}')
+
+def main():
+    board = chess.Board()
+    multipv = 1
+    search_thread = None
+    stop_event = threading.Event()
+
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+
+        if command == 'uci':
+            send('id name Fake Engine')
+            send('id author Chess Snapshot')
+            send('option name Threads type spin default 1 min 1 max 1024')
+            send('option name Hash type spin default 16 min 1 max 33554432')
+            send('option name MultiPV type spin default 1 min 1 max 500')
+            send('uciok')
+        elif command == 'isready':
+            send('readyok')
+        elif command == 'setoption' and len(tokens) >= 5 and tokens[2] == 'MultiPV':
+            multipv = int(tokens[4])
+        elif command == 'ucinewgame':
+            board = chess.Board()
+        elif command == 'position':
+            moves_index = tokens.index('moves') if 'moves' in tokens else len(tokens)
+            board = chess.Board() if tokens[1] == 'startpos' else chess.Board(' '.join(tokens[2:moves_index]))
+            for move in tokens[moves_index + 1:]:
+                board.push_uci(move)
+        elif command == 'go':
+            stop_event = threading.Event()
+            depth, movetime = parse_go(tokens[1:])
+            search_thread = threading.Thread(target=search, args=(board.copy(), depth, movetime, multipv, stop_event))
+            search_thread.start()
+        elif command == 'stop':
+            stop_event.set()
+            if search_thread is not None:
+                search_thread.join()
+        elif command == 'quit':
+            break
+
+    stop_event.set()
+    if search_thread is not None:
+        search_thread.join()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+import chess
+import cv2 as cv
+import numpy as np
+
+from utils.board_renderer import DIFFICULTIES, THEMES, PieceSprites, render_scene
+from utils.corpus import FEN_EXTENSION
+
+_sprites = None
+_settings = None
+
+
+def random_fen(rng, max_plies=80):
+    """Position reached by a random game of up to max_plies moves"""
+    board = chess.Board()
+    for _ in range(int(rng.integers(0, max_plies + 1))):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        board.push(moves[rng.integers(len(moves))])
+    return board.fen()
+
+def read_fens(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+def init_worker(sprites_dir, font_path, settings):
+    """Load the piece sprites once per worker process"""
+    global _sprites, _settings
+    cv.setNumThreads(1)
+    _sprites = PieceSprites(sprites_dir, font_path)
+    _settings = settings
+
+def generate_one(task):
+    index, fen = task
+    # Seeded per image so that a corpus can be regenerated identically, whatever the number of workers
+    rng = np.random.default_rng([_settings['seed'], index])
+    if fen is None:
+        fen = random_fen(rng)
+    image = render_scene(fen, _sprites, rng, DIFFICULTIES[_settings['difficulty']],
+                         [THEMES[name] for name in _settings['themes']])
+
+    name = f"{_settings['prefix']}{index:06d}"
+    cv.imwrite(os.path.join(_settings['output'], f"{name}.{_settings['format']}"), image)
+    with open(os.path.join(_settings['output'], name + FEN_EXTENSION), 'w', encoding='utf-8') as f:
+        f.write(fen + '\n')
+    return name
+
+def generate_boards(output_dir, count=None, fens_path=None, difficulty='medium', themes=tuple(THEMES),
+                    sprites_dir=None, font_path=None, image_format='png', workers=None, seed=0, prefix='board_'):
+    """Write count rendered boards as <name>.<format> images with <name>.fen labels
+
+    Positions come from fens_path, cycled when count is larger, or from random games.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    fens = read_fens(fens_path) if fens_path else None
+    if count is None:
+        count = len(fens) if fens else 1000
+    tasks = [(index, fens[index % len(fens)] if fens else None) for index in range(count)]
+
+    settings = {'output': output_dir, 'difficulty': difficulty, 'themes': list(themes), 'format': image_format,
+                'seed': seed, 'prefix': prefix}
+    workers = workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=(sprites_dir, font_path or 'DejaVuSans.ttf', settings)) as pool:
+        for done, _ in enumerate(pool.imap_unordered(generate_one, tasks, chunksize=16), start=1):
+            if done % 500 == 0:
+                print(f"   {done}/{count}")
+
+    elapsed = time.perf_counter() - start_time
+    print(f"✅ {count} images générées dans {output_dir} en {elapsed:.1f}s ({count / elapsed * 60:.0f} images/min)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Génère des images d'échiquiers annotées à partir de positions FEN")
+    parser.add_argument('output', help="Dossier de sortie des images et fichiers <nom>.fen")
+    parser.add_argument('--count', type=int, default=None, help="Nombre d'images, 1000 par défaut sans --fens")
+    parser.add_argument('--fens', help="Fichier de positions FEN, une par ligne; positions de parties aléatoires sinon")
+    parser.add_argument('--difficulty', choices=list(DIFFICULTIES), default='medium',
+                        help="Perspective, flou, bruit, JPEG, éclairage et fond encombré maximaux")
+    parser.add_argument('--themes', nargs='+', choices=list(THEMES), default=list(THEMES), help="Couleurs d'échiquier")
+    parser.add_argument('--sprites', help="Dossier d'images de pièces wK.png, bN.png..., glyphes de police sinon")
+    parser.add_argument('--font', help="Police contenant les glyphes d'échecs")
+    parser.add_argument('--format', choices=('png', 'jpg'), default='png', help="Format des images")
+    parser.add_argument('--workers', type=int, default=None, help="Nombre de processus")
+    parser.add_argument('--seed', type=int, default=0, help="Graine aléatoire")
+    args = parser.parse_args()
+    generate_boards(args.output, args.count, args.fens, args.difficulty, args.themes, args.sprites, args.font,
+                    args.format, args.workers, args.seed)
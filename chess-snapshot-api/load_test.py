@@ -0,0 +1,195 @@
+"""
+Load generator for the Chess Snapshot API.
+
+Sends detection requests (images of a corpus directory) and/or best move
+requests (FEN positions) either closed-loop, each of --concurrency clients
+sending its next request when the previous one returns, or open-loop at a
+fixed --rate of Poisson arrivals. In open-loop mode latency is measured from
+the scheduled arrival time, so the time spent waiting for a free client counts
+as queueing instead of silently lowering the offered load.
+
+    python load_test.py http://localhost:8080 --images path/to/corpus --fens positions.fen --concurrency 16 --duration 60
+    python load_test.py http://localhost:8080 --fens positions.fen --rate 50 --concurrency 64
+"""
+
+import argparse
+import http.client
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from utils.corpus import IMAGE_EXTENSIONS
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Client:
+    """One keep-alive HTTP connection"""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connect = lambda: connection_class(parts.hostname, parts.port, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+        self.connection = self.connect()
+
+    def post(self, path, body, content_type):
+        try:
+            self.connection.request('POST', self.prefix + path, body=body, headers={'Content-Type': content_type})
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            # Reconnect for the next request, the server may have closed the connection
+            self.connection.close()
+            self.connection = self.connect()
+            raise
+
+
+def multipart_body(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+def load_requests(images_dir, fens_path, depth):
+    """(endpoint, path, body, content type) of every request to cycle through"""
+    requests = []
+    if images_dir:
+        for filename in sorted(os.listdir(images_dir)):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                with open(os.path.join(images_dir, filename), 'rb') as f:
+                    body, content_type = multipart_body('image', filename, f.read())
+                requests.append(('get_chess_position', '/api/get_chess_position', body, content_type))
+    if fens_path:
+        with open(fens_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    body = json.dumps({'fen': line.strip(), 'depth': depth}).encode()
+                    requests.append(('get_best_move', '/api/get_best_move', body, 'application/json'))
+    return requests
+
+def summarize(records, elapsed):
+    """Throughput, latency percentiles and error rates, overall and per endpoint"""
+    def summary(items):
+        latencies = [latency for _, _, latency in items]
+        errors = {}
+        for _, status, _ in items:
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        ok = len(items) - sum(errors.values())
+        result = {
+            'requests': len(items),
+            'throughput': ok / elapsed if elapsed else 0.0,
+            'error_rate': sum(errors.values()) / len(items) if items else 0.0,
+            'errors': errors,
+        }
+        if latencies:
+            result['latency_ms'] = {
+                'mean': float(np.mean(latencies)),
+                **{f'p{p}': float(np.percentile(latencies, p)) for p in PERCENTILES},
+                'max': float(np.max(latencies)),
+            }
+        return result
+
+    endpoints = sorted({endpoint for endpoint, _, _ in records})
+    return {
+        'duration': elapsed,
+        **summary(records),
+        'endpoints': {endpoint: summary([r for r in records if r[0] == endpoint]) for endpoint in endpoints},
+    }
+
+def run_load_test(base_url, requests, concurrency=8, rate=None, duration=30.0, timeout=60.0, seed=0):
+    """Drive the API for duration seconds and return the summary of the completed requests"""
+    records = []
+    records_lock = threading.Lock()
+    arrivals = queue.Queue()
+    start_time = time.perf_counter()
+    end_time = start_time + duration
+
+    def next_request(rng):
+        """Open loop: the next (scheduled time, request) arrival; closed loop: a new request as soon as possible"""
+        if rate:
+            return arrivals.get()
+        if time.perf_counter() >= end_time:
+            return None
+        return time.perf_counter(), rng.choice(requests)
+
+    def worker(worker_seed):
+        client = Client(base_url, timeout)
+        rng = random.Random(worker_seed)
+        while True:
+            item = next_request(rng)
+            if item is None:
+                return
+            scheduled_time, (endpoint, path, body, content_type) = item
+            try:
+                status = client.post(path, body, content_type)
+            except OSError as e:
+                status = 'timeout' if isinstance(e, TimeoutError) else type(e).__name__
+            except http.client.HTTPException as e:
+                status = type(e).__name__
+            with records_lock:
+                records.append((endpoint, status, (time.perf_counter() - scheduled_time) * 1000))
+
+    threads = [threading.Thread(target=worker, args=(f"{seed}-{index}",), daemon=True) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    if rate:
+        # Arrivals are queued on schedule whether or not a client is free to send them
+        rng = random.Random(seed)
+        next_time = start_time
+        while next_time < end_time:
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals.put((next_time, rng.choice(requests)))
+            next_time += rng.expovariate(rate)
+        for _ in threads:
+            arrivals.put(None)
+    for thread in threads:
+        thread.join()
+    return summarize(records, time.perf_counter() - start_time)
+
+def print_summary(summary):
+    print(f"⏱️ {summary['requests']} requêtes en {summary['duration']:.1f}s")
+    for name, result in [('total', summary)] + list(summary['endpoints'].items()):
+        line = f"   {name:<20} {result['throughput']:8.2f} req/s, erreurs {result['error_rate'] * 100:5.1f}%"
+        if 'latency_ms' in result:
+            latency = result['latency_ms']
+            line += ", latence " + " / ".join(f"p{p} {latency[f'p{p}']:.0f}" for p in PERCENTILES) + \
+                    f" / max {latency['max']:.0f} ms"
+        print(line)
+        if result['errors']:
+            print(f"      {result['errors']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Test de charge de l'API Chess Snapshot")
+    parser.add_argument('url', help="Adresse de l'API, par exemple http://localhost:8080")
+    parser.add_argument('--images', help="Dossier d'images envoyées à /api/get_chess_position")
+    parser.add_argument('--fens', help="Fichier de positions FEN envoyées à /api/get_best_move")
+    parser.add_argument('--depth', type=int, default=15, help="Profondeur demandée à /api/get_best_move")
+    parser.add_argument('--concurrency', type=int, default=8, help="Nombre de clients simultanés")
+    parser.add_argument('--rate', type=float, default=None,
+                        help="Arrivées par seconde (boucle ouverte); sans cette option chaque client enchaîne ses requêtes")
+    parser.add_argument('--duration', type=float, default=30.0, help="Durée du test en secondes")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Délai maximal par requête en secondes")
+    parser.add_argument('--output', help="Fichier JSON où enregistrer le résumé")
+    args = parser.parse_args()
+
+    requests = load_requests(args.images, args.fens, args.depth)
+    if not requests:
+        parser.error("--images ou --fens est requis")
+    summary = run_load_test(args.url, requests, args.concurrency, args.rate, args.duration, args.timeout)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
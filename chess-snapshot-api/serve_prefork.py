@@ -0,0 +1,157 @@
+"""
+Pre-fork serving mode for the Chess Snapshot API.
+
+The master process loads the piece model weights once, without running them,
+freezes the garbage collector so that collections in the workers do not write
+to the pages of the objects created so far, then forks the workers. Model
+weights are never written during inference, so their pages stay shared
+copy-on-write between all workers and each worker only adds its own unique
+memory (USS). The TensorFlow and PyTorch runtimes and their thread pools do
+not survive a fork once they have run, so nothing is inferred in the master:
+each worker warms up its models after the fork, loading the small lattice
+points model itself since loading a Keras model starts TensorFlow. SQLite
+connections are closed before the fork and opened again by each worker. The
+master restarts workers that exit and can periodically report the memory of
+each worker.
+
+CUDA contexts cannot be shared across fork, so on GPU machines the models are
+loaded in each worker instead.
+
+Each worker gets an equal share of the CPUs as its thread budget and can be
+pinned to its own CPUs with --pin-cpus.
+
+    python serve_prefork.py --workers 4 --port 8080 --report-memory 60
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+import app as chess_snapshot_app
+from thread_budget import ThreadBudget
+from utils.memory import process_memory
+
+
+def preload_models():
+    """Load the piece model weights in the master process, without running them, unless CUDA is used"""
+    from gpu_config import GPUConfig
+
+    if GPUConfig().cuda_available:
+        print("⚠️ CUDA détecté: les modèles seront chargés dans chaque worker")
+        return False
+
+    # The Keras lattice points model is loaded lazily by the warmup of each worker
+    chess_snapshot_app.get_chess_position_detector()
+    gc.collect()
+    gc.freeze()
+    return True
+
+def close_connections():
+    """Close the SQLite connections of the master, which a forked worker must not use"""
+    chess_snapshot_app.position_cache.close()
+    chess_snapshot_app.analysis_service.store.close()
+
+def create_socket(host, port, backlog=128):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(sock, host, port, preloaded, worker_index=None):
+    """Serve requests on the shared listening socket, one at a time"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if worker_index is not None:
+        ThreadBudget().set_affinity(worker_index)
+
+    detector = chess_snapshot_app.get_chess_position_detector()
+    if preloaded:
+        detector.reset_executor()
+    # The inference runtimes and their thread pools start here, in the worker
+    detector.warmup()
+
+    server = make_server(host, port, chess_snapshot_app.app, threaded=False, fd=sock.fileno())
+    server.serve_forever()
+
+def spawn_worker(sock, host, port, preloaded, worker_index=None):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(sock, host, port, preloaded, worker_index)
+        finally:
+            os._exit(0)
+    return pid
+
+def report_memory(workers):
+    master = process_memory()
+    print(f"🧠 master {os.getpid()}: RSS {master['rss'] / 1024**2:.0f} Mo, USS {master['uss'] / 1024**2:.0f} Mo")
+    for pid in sorted(workers):
+        try:
+            memory = process_memory(pid)
+        except OSError:
+            continue
+        print(f"   worker {pid}: RSS {memory['rss'] / 1024**2:.0f} Mo, "
+              f"PSS {memory['pss'] / 1024**2:.0f} Mo, USS {memory['uss'] / 1024**2:.0f} Mo")
+    sys.stdout.flush()
+
+def serve(host, port, workers_count, report_interval=None, pin_cpus=False):
+    # Read by the ThreadBudget of the master and, through fork, of the workers
+    os.environ['CHESS_WORKERS'] = str(workers_count)
+    preloaded = preload_models()
+    close_connections()
+    sock = create_socket(host, port)
+
+    workers = {}
+    for worker_index in range(workers_count):
+        pid = spawn_worker(sock, host, port, preloaded, worker_index if pin_cpus else None)
+        workers[pid] = worker_index
+    print(f"✅ {workers_count} workers à l'écoute sur {host}:{port}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    last_report = time.monotonic()
+    while workers:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid in workers:
+            worker_index = workers.pop(pid)
+            if not stopping:
+                print(f"⚠️ Worker {pid} arrêté, redémarrage")
+                new_pid = spawn_worker(sock, host, port, preloaded, worker_index if pin_cpus else None)
+                workers[new_pid] = worker_index
+            continue
+
+        if report_interval and time.monotonic() - last_report >= report_interval:
+            report_memory(workers)
+            last_report = time.monotonic()
+        time.sleep(0.5)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serveur pre-fork partageant les modèles entre les workers")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--report-memory', type=float, default=None, metavar='SECONDES',
+                        help="Affiche la mémoire de chaque worker à cet intervalle")
+    parser.add_argument('--pin-cpus', action='store_true', help="Attache chaque worker à ses propres CPU")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.report_memory, args.pin_cpus)
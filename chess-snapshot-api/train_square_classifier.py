@@ -0,0 +1,116 @@
+"""
+Training of the 64-square classifier used by ChessPositionDetector(mode='squares').
+
+Flat boards of random positions are rendered with the themes and piece images
+of generate_boards.py, cut into padded square crops the way the detector cuts a
+rectified board, and a YOLO classification model is fine-tuned on them. The
+model is written with the FEN piece letters and 'empty' as class names:
+
+    python train_square_classifier.py --boards 2000 --epochs 20 --output models/chess_squares.model.pt
+"""
+
+import argparse
+import os
+import shutil
+
+import cv2 as cv
+import numpy as np
+
+from generate_boards import random_fen
+from utils.board_renderer import THEMES, PieceSprites, render_board
+from utils.fen import EMPTY_SQUARE, PIECE_CLASSES, fen_to_board
+from utils.other import split_squares
+
+MODEL_PATH = 'models/chess_squares.model.pt'
+BASE_MODEL = 'yolov8n-cls.pt'
+# ChessSquaresClassifier.IMAGE_SIZE
+IMAGE_SIZE = 64
+# ChessPositionDetector.SQUARE_PADDING, the context around each square the classifier sees
+SQUARE_PADDING = 0.25
+# Most squares are empty: only this share of them is kept
+EMPTY_SHARE = 0.25
+VALIDATION_SHARE = 0.1
+EMPTY_CLASS_NAME = 'empty'
+# Dataset folders per class, since folders named b and B are the same one on case-insensitive file systems
+CLASS_FOLDERS = {piece: f"{'white' if piece.isupper() else 'black'}_{piece.lower()}" for piece in PIECE_CLASSES}
+CLASS_FOLDERS[EMPTY_SQUARE] = EMPTY_CLASS_NAME
+
+
+def degrade(image, rng):
+    """Light blur, noise and JPEG compression, as on a screenshot or a photo of a rectified board"""
+    if rng.random() < 0.5:
+        image = cv.GaussianBlur(image, (3, 3), rng.uniform(0.1, 1.0))
+    noise = rng.normal(0, rng.uniform(0, 6), image.shape)
+    image = np.clip(image + noise, 0, 255).astype(np.uint8)
+    if rng.random() < 0.5:
+        _, encoded = cv.imencode('.jpg', image, [cv.IMWRITE_JPEG_QUALITY, int(rng.integers(40, 95))])
+        image = cv.imdecode(encoded, cv.IMREAD_COLOR)
+    return image
+
+def build_dataset(dataset_dir, boards, sprites_dir=None, font_path=None, seed=0):
+    """Render boards random positions and write their square crops to dataset_dir/{train,val}/<class folder>/"""
+    rng = np.random.default_rng(seed)
+    sprites = PieceSprites(sprites_dir, font_path or 'DejaVuSans.ttf')
+    themes = list(THEMES.values())
+    for split in ('train', 'val'):
+        for folder in CLASS_FOLDERS.values():
+            os.makedirs(os.path.join(dataset_dir, split, folder), exist_ok=True)
+
+    crops = 0
+    for index in range(boards):
+        fen = random_fen(rng)
+        square_size = int(rng.integers(40, 97))
+        image = render_board(fen, sprites, square_size, themes[rng.integers(len(themes))])
+        image = degrade(image, rng)
+        split = 'val' if rng.random() < VALIDATION_SHARE else 'train'
+        labels = [square for row in fen_to_board(fen) for square in row]
+        for square, (label, crop) in enumerate(zip(labels, split_squares(image, SQUARE_PADDING))):
+            if label == EMPTY_SQUARE and rng.random() >= EMPTY_SHARE:
+                continue
+            cv.imwrite(os.path.join(dataset_dir, split, CLASS_FOLDERS[label], f'{index:06d}_{square:02d}.png'), crop)
+            crops += 1
+    print(f"✅ {crops} cases extraites de {boards} échiquiers dans {dataset_dir}")
+
+def export_model(weights_path, output_path):
+    """Copy the trained weights to output_path with the FEN letters and 'empty' as class names"""
+    import torch
+
+    folder_classes = {folder: EMPTY_CLASS_NAME if square == EMPTY_SQUARE else square
+                      for square, folder in CLASS_FOLDERS.items()}
+    checkpoint = torch.load(weights_path, map_location='cpu')
+    for key in ('model', 'ema'):
+        if checkpoint.get(key) is not None:
+            checkpoint[key].names = {index: folder_classes[name] for index, name in checkpoint[key].names.items()}
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    torch.save(checkpoint, output_path)
+    print(f"✅ Modèle de classification des cases enregistré dans {output_path}")
+
+def train_square_classifier(output_path=MODEL_PATH, boards=2000, epochs=20, dataset_dir='square_dataset',
+                            base_model=BASE_MODEL, sprites_dir=None, font_path=None, seed=0, keep_dataset=False):
+    """Render a square dataset, fine-tune base_model on it and export the result to output_path"""
+    from ultralytics import YOLO
+
+    build_dataset(dataset_dir, boards, sprites_dir, font_path, seed)
+    try:
+        model = YOLO(base_model, task='classify')
+        model.train(data=os.path.abspath(dataset_dir), epochs=epochs, imgsz=IMAGE_SIZE, seed=seed,
+                    project=os.path.abspath(os.path.join(dataset_dir, 'runs')), name='squares')
+        export_model(model.trainer.best, output_path)
+    finally:
+        if not keep_dataset:
+            shutil.rmtree(dataset_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Entraîne le classifieur des 64 cases sur des échiquiers générés")
+    parser.add_argument('--output', default=MODEL_PATH, help="Fichier du modèle entraîné")
+    parser.add_argument('--boards', type=int, default=2000, help="Nombre d'échiquiers générés")
+    parser.add_argument('--epochs', type=int, default=20, help="Nombre d'époques d'entraînement")
+    parser.add_argument('--dataset', default='square_dataset', help="Dossier temporaire des images de cases")
+    parser.add_argument('--base-model', default=BASE_MODEL, help="Modèle YOLO de classification de départ")
+    parser.add_argument('--sprites', help="Dossier d'images de pièces wK.png, bN.png..., glyphes de police sinon")
+    parser.add_argument('--font', help="Police contenant les glyphes d'échecs")
+    parser.add_argument('--seed', type=int, default=0, help="Graine aléatoire")
+    parser.add_argument('--keep-dataset', action='store_true', help="Garde les images de cases après l'entraînement")
+    args = parser.parse_args()
+    train_square_classifier(args.output, args.boards, args.epochs, args.dataset, args.base_model, args.sprites,
+                            args.font, args.seed, args.keep_dataset)
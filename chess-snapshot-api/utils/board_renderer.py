@@ -0,0 +1,173 @@
+import os
+
+import cv2 as cv
+import numpy as np
+
+from utils.fen import EMPTY_SQUARE, fen_to_board
+
+# (light, dark) square colors, BGR
+THEMES = {
+    'brown': ((181, 217, 240), (99, 136, 181)),
+    'green': ((210, 238, 238), (86, 150, 118)),
+    'blue': ((234, 233, 222), (177, 140, 84)),
+    'gray': ((220, 220, 220), (140, 140, 140)),
+    'purple': ((232, 220, 232), (154, 112, 136)),
+}
+
+# Upper bounds of the random degradations applied at each difficulty
+DIFFICULTIES = {
+    'easy': {'warp': 0.0, 'rotation': 0.0, 'blur': 0.0, 'noise': 0.0, 'jpeg': None, 'gradient': 0.0, 'clutter': 0},
+    'medium': {'warp': 0.05, 'rotation': 4.0, 'blur': 1.0, 'noise': 5.0, 'jpeg': 60, 'gradient': 0.25, 'clutter': 6},
+    'hard': {'warp': 0.12, 'rotation': 10.0, 'blur': 2.0, 'noise': 12.0, 'jpeg': 30, 'gradient': 0.5, 'clutter': 20},
+}
+
+GLYPHS = {'k': '♚', 'q': '♛', 'r': '♜', 'b': '♝', 'n': '♞', 'p': '♟'}
+GLYPH_FONT = 'DejaVuSans.ttf'
+
+
+class PieceSprites:
+    """BGRA piece images per square size, loaded from a directory of wK.png, bN.png... files or drawn from font glyphs"""
+
+    def __init__(self, sprites_dir=None, font_path=GLYPH_FONT):
+        self.sprites_dir = sprites_dir
+        self.font_path = font_path
+        self.originals = {}
+        self.cache = {}
+        if sprites_dir:
+            for piece in GLYPHS:
+                for color, letter in (('w', piece.upper()), ('b', piece)):
+                    image = cv.imread(os.path.join(sprites_dir, f'{color}{piece.upper()}.png'), cv.IMREAD_UNCHANGED)
+                    if image is None:
+                        raise FileNotFoundError(f'Missing sprite {color}{piece.upper()}.png in {sprites_dir}')
+                    if image.shape[2] == 3:
+                        image = cv.cvtColor(image, cv.COLOR_BGR2BGRA)
+                    self.originals[letter] = image
+
+    def get(self, letter, size):
+        key = (letter, size)
+        if key not in self.cache:
+            if letter in self.originals:
+                self.cache[key] = cv.resize(self.originals[letter], (size, size), interpolation=cv.INTER_AREA)
+            else:
+                self.cache[key] = self.draw_glyph(letter, size)
+        return self.cache[key]
+
+    def draw_glyph(self, letter, size):
+        """Filled chess glyph, white with a dark outline or black with a light one"""
+        white = letter.isupper()
+        fill, stroke = ((255, 255, 255, 255), (0, 0, 0, 255)) if white else ((0, 0, 0, 255), (255, 255, 255, 255))
+        try:
+            from PIL import Image, ImageDraw, ImageFont
+            font = ImageFont.truetype(self.font_path, int(size * 0.9))
+        except (ImportError, OSError):
+            # No font with chess glyphs: the piece letter
+            sprite = np.zeros((size, size, 4), dtype=np.uint8)
+            scale = size / 40
+            origin = (int(size * 0.22), int(size * 0.78))
+            cv.putText(sprite, letter.upper(), origin, cv.FONT_HERSHEY_DUPLEX, scale, stroke, max(2, size // 8), cv.LINE_AA)
+            cv.putText(sprite, letter.upper(), origin, cv.FONT_HERSHEY_DUPLEX, scale, fill, max(1, size // 16), cv.LINE_AA)
+            return sprite
+
+        image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        draw.text((size / 2, size / 2), GLYPHS[letter.lower()], font=font, fill=fill, anchor='mm',
+                  stroke_width=max(1, size // 24), stroke_fill=stroke)
+        return cv.cvtColor(np.array(image), cv.COLOR_RGBA2BGRA)
+
+
+def overlay(image, sprite, x, y):
+    """Alpha-blend a BGRA sprite onto a BGR image at (x, y)"""
+    height, width = sprite.shape[:2]
+    alpha = sprite[:, :, 3:4].astype(np.float32) / 255
+    region = image[y:y + height, x:x + width]
+    region[:] = (sprite[:, :, :3] * alpha + region * (1 - alpha)).astype(np.uint8)
+
+def render_board(fen, sprites, square_size=64, theme=THEMES['brown']):
+    """Flat top-down board of the FEN position, white at the bottom"""
+    board = fen_to_board(fen)
+    light, dark = theme
+    image = np.empty((8 * square_size, 8 * square_size, 3), dtype=np.uint8)
+    piece_size = int(square_size * 0.9)
+    offset = (square_size - piece_size) // 2
+    for row in range(8):
+        for col in range(8):
+            x, y = col * square_size, row * square_size
+            image[y:y + square_size, x:x + square_size] = light if (row + col) % 2 == 0 else dark
+            if board[row][col] != EMPTY_SQUARE:
+                overlay(image, sprites.get(board[row][col], piece_size), x + offset, y + offset)
+    return image
+
+def draw_clutter(image, count, rng):
+    """Random lines, rectangles, circles and text, the kind of background the line detector has to ignore"""
+    height, width = image.shape[:2]
+    for _ in range(count):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        x1, x2 = sorted(rng.integers(0, width, 2))
+        y1, y2 = sorted(rng.integers(0, height, 2))
+        kind = rng.integers(0, 4)
+        if kind == 0:
+            cv.line(image, (int(x1), int(y1)), (int(x2), int(y2)), color, int(rng.integers(1, 4)))
+        elif kind == 1:
+            cv.rectangle(image, (int(x1), int(y1)), (int(x2), int(y2)), color, int(rng.choice([-1, 1, 2])))
+        elif kind == 2:
+            cv.circle(image, (int(x1), int(y1)), int(rng.integers(5, max(6, width // 8))), color, int(rng.choice([-1, 2])))
+        else:
+            cv.putText(image, 'e4 Nf3 1-0', (int(x1), int(y1)), cv.FONT_HERSHEY_SIMPLEX, float(rng.uniform(0.4, 1.5)),
+                       color, 1, cv.LINE_AA)
+
+def apply_gradient(image, strength, rng):
+    """Multiply by a linear lighting ramp from 1 - strength to 1 + strength in a random direction"""
+    height, width = image.shape[:2]
+    angle = rng.uniform(0, 2 * np.pi)
+    xs = np.arange(width, dtype=np.float32)[None, :] * np.float32(np.cos(angle))
+    ys = np.arange(height, dtype=np.float32)[:, None] * np.float32(np.sin(angle))
+    ramp = xs + ys
+    ramp = (ramp - ramp.min()) / max(float(np.ptp(ramp)), 1.0)
+    gain = np.float32(1 - strength) + np.float32(2 * strength) * ramp
+    return cv.multiply(image, cv.merge([gain] * 3), dtype=cv.CV_8U)
+
+def render_scene(fen, sprites, rng, difficulty=DIFFICULTIES['medium'], themes=tuple(THEMES.values())):
+    """Board of the FEN position on a cluttered background, warped, lit, blurred, noised and JPEG compressed
+    at random up to the limits of difficulty"""
+    square_size = int(rng.integers(32, 96))
+    board = render_board(fen, sprites, square_size, themes[rng.integers(len(themes))])
+    board_size = board.shape[0]
+
+    # Board corners: rotated around the center, then moved independently for the perspective
+    source = np.float32([[0, 0], [board_size, 0], [board_size, board_size], [0, board_size]])
+    angle = np.radians(rng.uniform(-difficulty['rotation'], difficulty['rotation']))
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    corners = (source - board_size / 2) @ rotation.T
+    corners += rng.uniform(-difficulty['warp'], difficulty['warp'], (4, 2)) * board_size
+
+    # The canvas keeps a margin around the whole warped board, so that no square is cut
+    margin = int(board_size * rng.uniform(0.08, 0.35))
+    corners += margin - corners.min(axis=0)
+    width, height = (np.ceil(corners.max(axis=0)).astype(int) + margin).tolist()
+    matrix = cv.getPerspectiveTransform(source, corners.astype(np.float32))
+
+    canvas = np.empty((height, width, 3), dtype=np.uint8)
+    canvas[:] = rng.integers(0, 256, 3)
+    draw_clutter(canvas, int(rng.integers(0, difficulty['clutter'] + 1)), rng)
+
+    warped = cv.warpPerspective(board, matrix, (width, height))
+    mask = cv.warpPerspective(np.full(board.shape[:2], 255, np.uint8), matrix, (width, height))
+    image = np.where(mask[:, :, None] > 127, warped, canvas)
+
+    if difficulty['gradient']:
+        image = apply_gradient(image, rng.uniform(0, difficulty['gradient']), rng)
+    if difficulty['blur']:
+        sigma = rng.uniform(0, difficulty['blur'])
+        if sigma > 0.3:
+            image = cv.GaussianBlur(image, (0, 0), sigma)
+    if difficulty['noise']:
+        # OpenCV's generator, seeded from rng, is several times faster than numpy's on full images
+        sigma = rng.uniform(0, difficulty['noise'])
+        noise = np.empty(image.shape, dtype=np.int16)
+        cv.setRNGSeed(int(rng.integers(2 ** 31)))
+        cv.randn(noise, (0, 0, 0), (sigma, sigma, sigma))
+        image = cv.add(image, noise, dtype=cv.CV_8U)
+    if difficulty['jpeg']:
+        quality = int(rng.integers(difficulty['jpeg'], 96))
+        image = cv.imdecode(cv.imencode('.jpg', image, [cv.IMWRITE_JPEG_QUALITY, quality])[1], cv.IMREAD_COLOR)
+    return image
@@ -0,0 +1,20 @@
+import os
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+FEN_EXTENSION = '.fen'
+
+
+def iter_labelled_images(directory):
+    """Yield (image_path, fen) pairs for images that have a '<name>.fen' file next to them"""
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+
+        fen_path = os.path.join(directory, name + FEN_EXTENSION)
+        if not os.path.exists(fen_path):
+            continue
+
+        with open(fen_path, 'r', encoding='utf-8') as f:
+            fen = f.read().strip()
+        yield os.path.join(directory, filename), fen
@@ -1,4 +1,5 @@
 import cv2 as cv
+import numpy as np
 
 
 def draw_lines(img, lines, color=(0, 0, 255), thickness=1):
@@ -12,4 +13,16 @@ def draw_points(img, points, color=(255, 0, 0), radius=5):
     """Draw points on an image"""
     for point in points:
         img = cv.circle(img, point, radius, color, -1)
-    return img
\ No newline at end of file
+    return img
+
+def draw_checkerboard(square_size=64, margin=48, light=(240, 217, 181), dark=(99, 136, 181)):
+    """Draw an empty 8x8 board on a white background"""
+    size = 8 * square_size + 2 * margin
+    img = np.full((size, size, 3), 255, dtype=np.uint8)
+    for row in range(8):
+        for col in range(8):
+            x = margin + col * square_size
+            y = margin + row * square_size
+            color = light if (row + col) % 2 == 0 else dark
+            img[y:y + square_size, x:x + square_size] = color
+    return img
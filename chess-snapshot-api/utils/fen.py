@@ -0,0 +1,115 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+PIECE_CLASSES = ['b', 'k', 'n', 'p', 'q', 'r', 'B', 'K', 'N', 'P', 'Q', 'R']
+EMPTY_SQUARE = '.'
+SQUARE_CLASSES = PIECE_CLASSES + [EMPTY_SQUARE]
+
+PIECES_MAX_COUNT = {
+    'b': 8, 'k': 1, 'n': 2, 'p': 8, 'q': 1, 'r': 2,
+    'B': 8, 'K': 1, 'N': 2, 'P': 8, 'Q': 1, 'R': 2
+}
+
+# Score given to forbidden placements (pawns on the first or last rank, classes without evidence)
+FORBIDDEN_SCORE = -1e6
+
+
+def board_to_fen(chessboard):
+    """Convert an 8x8 board of piece letters to the FEN piece placement field"""
+    fen_rows = []
+    for row in chessboard:
+        fen_row = ''
+        empty_count = 0
+        for square in row:
+            if square == EMPTY_SQUARE:
+                empty_count += 1
+            else:
+                if empty_count > 0:
+                    fen_row += str(empty_count)
+                    empty_count = 0
+                fen_row += square
+        if empty_count > 0:
+            fen_row += str(empty_count)
+        fen_rows.append(fen_row)
+
+    return '/'.join(fen_rows)
+
+def fen_to_board(fen):
+    """Convert the FEN piece placement field to an 8x8 board of piece letters"""
+    chessboard = []
+    for fen_row in fen.split()[0].split('/'):
+        row = []
+        for char in fen_row:
+            if char.isdigit():
+                row += [EMPTY_SQUARE] * int(char)
+            else:
+                row.append(char)
+        chessboard.append(row)
+    return chessboard
+
+def square_accuracy(predicted_fen, expected_fen):
+    """Fraction of the 64 squares on which two FEN strings agree"""
+    predicted = fen_to_board(predicted_fen)
+    expected = fen_to_board(expected_fen)
+
+    correct = 0
+    for row in range(8):
+        for col in range(8):
+            if row < len(predicted) and col < len(predicted[row]) and predicted[row][col] == expected[row][col]:
+                correct += 1
+    return correct / 64
+
+def assign_squares(square_scores, empty_scores=None, max_counts=PIECES_MAX_COUNT):
+    """Assign one class per square maximizing the total score under piece count constraints
+
+    square_scores maps (row, col) to an array of scores ordered as PIECE_CLASSES,
+    empty_scores optionally maps (row, col) to the score of the square being empty
+    (0 when missing). Every piece letter gets max_counts slots, every square an
+    empty slot, and the squares are matched to slots with linear_sum_assignment,
+    so an overflowing piece type falls back to the next best class of the boxes
+    that fit it least instead of being re-detected.
+    """
+    chessboard = [[EMPTY_SQUARE for _ in range(8)] for _ in range(8)]
+    squares = sorted(square_scores)
+    if not squares:
+        return chessboard
+
+    slot_classes = []
+    for piece_index, piece_type in enumerate(PIECE_CLASSES):
+        slot_classes += [piece_index] * max_counts[piece_type]
+    pawn_indices = [PIECE_CLASSES.index('p'), PIECE_CLASSES.index('P')]
+
+    scores = np.zeros((len(squares), len(slot_classes) + len(squares)), dtype=np.float64)
+    for i, (row, col) in enumerate(squares):
+        piece_scores = np.array(square_scores[(row, col)], dtype=np.float64)
+        piece_scores[piece_scores <= 0] = FORBIDDEN_SCORE
+        if row in (0, 7):
+            piece_scores[pawn_indices] = FORBIDDEN_SCORE
+        scores[i, :len(slot_classes)] = piece_scores[slot_classes]
+        if empty_scores is not None:
+            scores[i, len(slot_classes) + i] = empty_scores.get((row, col), 0.0)
+        # Each square may only use its own empty slot
+        scores[i, len(slot_classes):len(slot_classes) + i] = FORBIDDEN_SCORE
+        scores[i, len(slot_classes) + i + 1:] = FORBIDDEN_SCORE
+
+    square_indices, slot_indices = linear_sum_assignment(scores, maximize=True)
+    for i, slot in zip(square_indices, slot_indices):
+        if slot < len(slot_classes):
+            row, col = squares[i]
+            chessboard[row][col] = PIECE_CLASSES[slot_classes[slot]]
+
+    return chessboard
+
+def board_confidence(chessboard, square_scores, empty_scores=None):
+    """Mean score of the class chosen for each scored square, 0 when no square was scored"""
+    if not square_scores:
+        return 0.0
+
+    total = 0.0
+    for row, col in square_scores:
+        square = chessboard[row][col]
+        if square == EMPTY_SQUARE:
+            total += empty_scores.get((row, col), 0.0) if empty_scores is not None else 0.0
+        else:
+            total += float(square_scores[(row, col)][PIECE_CLASSES.index(square)])
+    return total / len(square_scores)
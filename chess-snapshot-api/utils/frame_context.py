@@ -0,0 +1,53 @@
+import threading
+
+import cv2 as cv
+
+from utils.other import resize_image
+
+
+def read_only(image):
+    """Return a read-only view of an image"""
+    view = image.view()
+    view.setflags(write=False)
+    return view
+
+
+class FrameContext:
+    """Preprocessing of one input frame, computed once on first use and shared read-only by the detection stages"""
+    MAX_SIZE = 700
+
+    def __init__(self, image, max_size=MAX_SIZE):
+        self.original_image = read_only(image)
+        self.max_size = max_size
+        self.levels = {}
+        # Corners of the board in image found by a coarse pass, where rectification can start
+        self.board_corners = None
+        self._gray = None
+        self._lock = threading.Lock()
+
+    def scaled(self, max_size):
+        """Image pyramid level resized to max_size, cached per size"""
+        with self._lock:
+            if max_size not in self.levels:
+                self.levels[max_size] = read_only(resize_image(self.original_image, max_size))
+            return self.levels[max_size]
+
+    @property
+    def image(self):
+        return self.scaled(self.max_size)
+
+    @property
+    def gray(self):
+        image = self.image
+        with self._lock:
+            if self._gray is None:
+                if len(image.shape) == 3:
+                    self._gray = read_only(cv.cvtColor(image, cv.COLOR_BGR2GRAY))
+                else:
+                    self._gray = image
+            return self._gray
+
+    def prepare(self):
+        """Compute the resized and grayscale images now instead of on first use"""
+        self.gray
+        return self
@@ -0,0 +1,73 @@
+import struct
+
+import cv2 as cv
+import numpy as np
+
+REDUCED_MODES = (
+    (8, cv.IMREAD_REDUCED_COLOR_8),
+    (4, cv.IMREAD_REDUCED_COLOR_4),
+    (2, cv.IMREAD_REDUCED_COLOR_2),
+)
+
+# JPEG start-of-frame markers carrying the image size (all SOFn except DHT, JPG and DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_jpeg_size(image_bytes):
+    """Read (width, height) from the JPEG start-of-frame segment"""
+    offset = 2
+    while offset + 9 <= len(image_bytes):
+        if image_bytes[offset] != 0xFF:
+            return None
+        marker = image_bytes[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        segment_length = struct.unpack('>H', image_bytes[offset + 2:offset + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', image_bytes[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + segment_length
+    return None
+
+def read_image_size(image_bytes):
+    """Read (width, height) from the image header without decoding it, or None for unknown formats"""
+    if image_bytes[:8] == b'\x89PNG\r\n\x1a\n' and len(image_bytes) >= 24:
+        return struct.unpack('>II', image_bytes[16:24])
+    if image_bytes[:2] == b'\xff\xd8':
+        return read_jpeg_size(image_bytes)
+    if image_bytes[:6] in (b'GIF87a', b'GIF89a') and len(image_bytes) >= 10:
+        return struct.unpack('<HH', image_bytes[6:10])
+    if image_bytes[:2] == b'BM' and len(image_bytes) >= 26:
+        width, height = struct.unpack('<ii', image_bytes[18:26])
+        return width, abs(height)
+    return None
+
+def reduced_decode_mode(width, height, target_size):
+    """Largest reduced decode mode keeping the smaller image side above target_size
+
+    The decoded image is then still larger than target_size, so that resize_image
+    scales it down to the same size as the full resolution image.
+    """
+    for factor, mode in REDUCED_MODES:
+        if min(width, height) // factor > target_size:
+            return mode
+    return cv.IMREAD_COLOR
+
+def decode_image(image_bytes, target_size=None):
+    """Decode an uploaded image, letting the decoder downscale it when it is much larger than target_size
+
+    For JPEG the reduced modes use libjpeg DCT scaling, so the full resolution
+    image is never materialized.
+    """
+    mode = cv.IMREAD_COLOR
+    if target_size:
+        size = read_image_size(image_bytes)
+        if size is not None:
+            mode = reduced_decode_mode(size[0], size[1], target_size)
+
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    return cv.imdecode(nparr, mode)
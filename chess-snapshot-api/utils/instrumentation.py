@@ -0,0 +1,175 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from utils import memory
+
+ENABLED = os.environ.get('CHESS_INSTRUMENTATION', '1') == '1'
+
+# Upper bounds in seconds of the stage duration histogram
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_STAGE = nullcontext()
+_current_trace = contextvars.ContextVar('chess_trace', default=None)
+_lock = threading.Lock()
+_durations = {}
+_counters = {}
+_memory_peaks = {}
+_memory_tracker = memory.create_tracker()
+
+
+class Trace:
+    """Stages and counts recorded while detecting one request, possibly from several threads"""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.stages = []
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def add_stage(self, name, start_time, duration, peaks=None):
+        with self.lock:
+            self.stages.append({
+                'stage': name,
+                'start_ms': (start_time - self.start_time) * 1000,
+                'ms': duration * 1000,
+                'thread': threading.current_thread().name,
+                **(peaks or {}),
+            })
+
+    def add_count(self, name, value):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_dict(self):
+        with self.lock:
+            return {'stages': sorted(self.stages, key=lambda stage: stage['start_ms']), 'counts': dict(self.counts)}
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.start_time = None
+        self.memory_tracker = None
+        self.memory_window = None
+
+    def __enter__(self):
+        # The window is closed by the tracker that opened it, even if tracking changes meanwhile
+        self.memory_tracker = _memory_tracker
+        if self.memory_tracker is not None:
+            self.memory_window = self.memory_tracker.start()
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        duration = time.perf_counter() - self.start_time
+        peaks = self.memory_tracker.stop(self.memory_window) if self.memory_window is not None else None
+        with _lock:
+            if peaks:
+                stage_peaks = _memory_peaks.setdefault(self.name, {})
+                for key, value in peaks.items():
+                    stage_peaks[key] = max(stage_peaks.get(key, 0), value)
+            histogram = _durations.get(self.name)
+            if histogram is None:
+                histogram = _durations[self.name] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    histogram['buckets'][index] += 1
+                    break
+            histogram['sum'] += duration
+            histogram['count'] += 1
+
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(self.name, self.start_time, duration, peaks)
+        return False
+
+
+def stage(name):
+    """Context manager timing a pipeline stage, doing nothing when instrumentation is disabled"""
+    if not ENABLED:
+        return _NULL_STAGE
+    return Stage(name)
+
+def set_memory_tracking(tracking):
+    """Measure the memory peaks of the stages: '0', 'rss' or 'all', overriding CHESS_MEMORY_TRACKING
+
+    Returns the new PeakTracker, or None when memory is no longer tracked.
+    """
+    global _memory_tracker
+    previous, _memory_tracker = _memory_tracker, memory.create_tracker(tracking)
+    if previous is not None:
+        previous.close()
+    return _memory_tracker
+
+def memory_peaks():
+    """Highest peak RSS and peak Python allocations in bytes seen for each stage"""
+    with _lock:
+        return {name: dict(peaks) for name, peaks in _memory_peaks.items()}
+
+def count(name, value=1):
+    """Add value to a pipeline counter, such as the number of lines or boxes found"""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_count(name, value)
+
+@contextmanager
+def trace():
+    """Record the stages and counts of the enclosed detection in a Trace
+
+    Work submitted to other threads is only recorded if it runs in a copy of
+    the current context (contextvars.copy_context().run).
+    """
+    if not ENABLED:
+        yield None
+        return
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+def render_prometheus():
+    """Stage durations and counters in the Prometheus text exposition format"""
+    with _lock:
+        durations = {name: {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']}
+                     for name, h in _durations.items()}
+        counters = dict(_counters)
+        memory_peaks = {name: dict(peaks) for name, peaks in _memory_peaks.items()}
+
+    lines = [
+        '# HELP chess_stage_duration_seconds Duration of the detection pipeline stages.',
+        '# TYPE chess_stage_duration_seconds histogram',
+    ]
+    for name in sorted(durations):
+        histogram = durations[name]
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, histogram['buckets']):
+            cumulative += bucket
+            lines.append(f'chess_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'chess_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'chess_stage_duration_seconds_sum{{stage="{name}"}} {histogram["sum"]}')
+        lines.append(f'chess_stage_duration_seconds_count{{stage="{name}"}} {histogram["count"]}')
+
+    lines += [
+        '# HELP chess_pipeline_items_total Items found by the detection pipeline stages.',
+        '# TYPE chess_pipeline_items_total counter',
+    ]
+    for name in sorted(counters):
+        lines.append(f'chess_pipeline_items_total{{item="{name}"}} {counters[name]}')
+
+    for key, help_text in (('peak_rss', 'Highest resident set size reached during the detection pipeline stages.'),
+                           ('peak_traced', 'Highest Python allocations made by the detection pipeline stages.')):
+        stages = [name for name in sorted(memory_peaks) if key in memory_peaks[name]]
+        if stages:
+            lines += [f'# HELP chess_stage_{key}_bytes {help_text}', f'# TYPE chess_stage_{key}_bytes gauge']
+            for name in stages:
+                lines.append(f'chess_stage_{key}_bytes{{stage="{name}"}} {memory_peaks[name][key]}')
+    return '\n'.join(lines) + '\n'
@@ -2,9 +2,11 @@ import cv2 as cv
 import numpy as np
 import sys
 import os
+import threading
 
 from keras.models import load_model
 from sklearn.cluster import DBSCAN
+from utils.instrumentation import count, stage
 from utils.other import median_distance
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -12,6 +14,33 @@ from gpu_config import GPUConfig
 
 
 class IntersectionsDetector:
+    MODEL_PATH = 'models/lattice_points.model.keras'
+
+    _model = None
+    _gpu_config = None
+    _model_lock = threading.Lock()
+
+    @staticmethod
+    def get_model():
+        """Load the lattice points model once per process"""
+        with IntersectionsDetector._model_lock:
+            if IntersectionsDetector._model is None:
+                gpu_config = GPUConfig()
+                gpu_config.configure_tensorflow_gpu()
+                IntersectionsDetector._gpu_config = gpu_config
+                IntersectionsDetector._model = load_model(IntersectionsDetector.MODEL_PATH)
+            return IntersectionsDetector._model
+
+    @staticmethod
+    def unload_model():
+        """Drop the lattice points model, get_model loads it again
+
+        Only this reference is dropped: clearing the Keras session would also free the models of other users
+        in the process. The memory is returned once nothing else refers to the model.
+        """
+        with IntersectionsDetector._model_lock:
+            IntersectionsDetector._model = None
+
     @staticmethod
     def get_intersections(lines):
         """Find intersections between lines"""
@@ -87,10 +116,8 @@ class IntersectionsDetector:
     @staticmethod
     def filter_intersections(image, intersections, size=10):
         """Filter intersections to remove false positives"""
-        gpu_config = GPUConfig()
-        gpu_config.configure_tensorflow_gpu()
-        
-        model = load_model('models/lattice_points.model.keras')
+        model = IntersectionsDetector.get_model()
+        gpu_config = IntersectionsDetector._gpu_config
 
         filtered_intersections = []
 
@@ -129,17 +156,55 @@ class IntersectionsDetector:
         return filtered_intersections
 
     @staticmethod
-    def detect(image, lines):
-        """Detect intersections between lines"""
-        intersections = IntersectionsDetector.get_intersections(lines)
-        if len(intersections) < 4:
+    def group_points(points, spacing, min_points, reach=1.25):
+        """Split lattice points into the groups of the boards they belong to, largest group first
+
+        spacing is the median_distance of the points, about 1.2 squares on a lattice. Points
+        of a board are chained to their neighbours one square apart, while the inner corners
+        of two boards are at least two squares apart, so reach spacings separate them.
+        """
+        if len(points) == 0:
             return []
-        intersections = IntersectionsDetector.cluster_points(intersections)
-        intersections = IntersectionsDetector.filter_intersections(image, intersections)
+
+        dbscan = DBSCAN(eps=spacing * reach, min_samples=3)
+        labels = dbscan.fit_predict(np.array(points))
+
+        groups = []
+        for label in set(labels) - {-1}:
+            group = [tuple(point) for point, point_label in zip(points, labels) if point_label == label]
+            if len(group) >= min_points:
+                groups.append(group)
+        return sorted(groups, key=len, reverse=True)
+
+    @staticmethod
+    def detect_lattice(image, lines):
+        """Lattice points found at the intersections of lines, before the outliers are removed"""
+        with stage('intersections'):
+            intersections = IntersectionsDetector.get_intersections(lines)
+            if len(intersections) < 4:
+                return []
+            intersections = IntersectionsDetector.cluster_points(intersections)
+        count('intersections', len(intersections))
+        with stage('lattice'):
+            intersections = IntersectionsDetector.filter_intersections(image, intersections)
+        count('lattice_points', len(intersections))
         if len(intersections) < 4:
             return []
-        intersections = IntersectionsDetector.cluster_points(intersections, 15)
+        return IntersectionsDetector.cluster_points(intersections, 15)
+
+    @staticmethod
+    def detect(image, lines):
+        """Detect intersections between lines"""
+        intersections = IntersectionsDetector.detect_lattice(image, lines)
         if len(intersections) < 4:
             return []
         intersections = IntersectionsDetector.remove_outliers(intersections, median_distance(intersections))
         return intersections
+
+    @staticmethod
+    def detect_groups(image, lines, min_points):
+        """Lattice points grouped per board, for images holding several boards"""
+        intersections = IntersectionsDetector.detect_lattice(image, lines)
+        if len(intersections) < min_points:
+            return []
+        return IntersectionsDetector.group_points(intersections, median_distance(intersections), min_points)
@@ -2,6 +2,7 @@ import cv2 as cv
 import numpy as np
 
 from utils.hough_bundler import HoughBundler
+from utils.instrumentation import count, stage
 
 CLAHE_PARAMS = [
     {'limit': 3, 'grid': (2, 6), 'iterations': 5},
@@ -44,11 +45,13 @@ class LinesDetector:
     def all_clahe_lines(img, clahe_params=CLAHE_PARAMS):
         """Find lines in an image using CLAHE, Canny Edge Detector and Hough Line Detector"""
         results = []
-        for params in clahe_params:
-            clahe_image = LinesDetector.clahe(img, params['limit'], params['grid'], params['iterations'])
-            edges = LinesDetector.canny(clahe_image)
-            lines = LinesDetector.hough_lines(edges)
+        for index, params in enumerate(clahe_params):
+            with stage(f'lines.variant{index}'):
+                clahe_image = LinesDetector.clahe(img, params['limit'], params['grid'], params['iterations'])
+                edges = LinesDetector.canny(clahe_image)
+                lines = LinesDetector.hough_lines(edges)
             results += list(lines)
+        count('raw_lines', len(results))
         return results
 
     @staticmethod
@@ -83,7 +86,10 @@ class LinesDetector:
             gray_image = image
 
         lines = LinesDetector.all_clahe_lines(gray_image)
-        lines = LinesDetector.filter_lines(lines)
-        bundler = HoughBundler(min_distance=10, min_angle=0.5)
-        lines = bundler.process_lines(lines)
+        with stage('lines.filter'):
+            lines = LinesDetector.filter_lines(lines)
+        with stage('bundling'):
+            bundler = HoughBundler(min_distance=10, min_angle=0.5)
+            lines = bundler.process_lines(lines)
+        count('lines', len(lines))
         return lines
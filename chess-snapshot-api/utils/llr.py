@@ -8,6 +8,7 @@ import matplotlib.path
 na = np.array
 
 from utils.geometry import isect_segments
+from utils.instrumentation import count
 
 ################################################################################
 
@@ -285,6 +286,7 @@ def LLR(img, points, lines):
 			S[-llr_polyscore(poly, points, centroid, \
 				beta=beta, alfa=alfa/2)] = poly                 # dodaj
 
+	count('llr_candidates', len(S))
 	S = collections.OrderedDict(sorted(S.items()))              # max
 	# print("SCORES:", list(S.keys()))                            # debug
 	# print("SCORES:", list(S.values()))                          # debug
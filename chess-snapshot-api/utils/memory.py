@@ -0,0 +1,212 @@
+import ctypes
+import ctypes.util
+import gc
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Measure the memory peak of each instrumented stage: '0', 'rss' (sampled resident set size)
+# or 'all' (RSS and Python allocations with tracemalloc, which slows allocation heavy code down)
+TRACKING = os.environ.get('CHESS_MEMORY_TRACKING', '0')
+RSS_SAMPLE_INTERVAL = 0.005
+
+# Trade speed for a lower and more predictable footprint on small instances
+LOW_MEMORY = os.environ.get('CHESS_LOW_MEMORY', '0') == '1'
+# Seconds without detection after which the models are unloaded, 0 to keep them loaded
+MODEL_IDLE_TIMEOUT = float(os.environ.get('CHESS_MODEL_IDLE_TIMEOUT', '300' if LOW_MEMORY else '0'))
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _load_malloc_trim():
+    """glibc's malloc_trim, or None on other C libraries; find_library runs ldconfig, so only once"""
+    libc_name = ctypes.util.find_library('c')
+    if not libc_name:
+        return None
+    try:
+        return ctypes.CDLL(libc_name).malloc_trim
+    except (OSError, AttributeError):
+        return None
+
+_malloc_trim = _load_malloc_trim()
+
+
+def process_memory(pid='self'):
+    """Resident, proportional and unique set sizes of a process in bytes, from /proc/<pid>/smaps_rollup
+
+    uss only counts pages private to the process, which is what each pre-forked
+    worker adds on top of the memory it shares with the master.
+    """
+    fields = {}
+    with open(os.path.join('/proc', str(pid), 'smaps_rollup'), 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+def current_rss():
+    """Resident set size of this process in bytes, cheap enough to be sampled every few milliseconds"""
+    try:
+        with open('/proc/self/statm', 'r', encoding='ascii') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # Without /proc, the peak since the start of the process is the best estimate
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def release_memory(collect=True):
+    """Collect garbage and hand the free heap pages back to the system, which glibc does not do by itself"""
+    if collect:
+        gc.collect()
+    if _malloc_trim is not None:
+        _malloc_trim(0)
+
+
+class PeakTracker:
+    """Peak RSS and peak Python allocations of the stages being measured
+
+    Stages can be nested or run concurrently in several threads: a peak reached
+    while several stages are open counts for each of them. RSS covers the native
+    memory of OpenCV, TensorFlow and PyTorch, tracemalloc only what goes through
+    Python's and numpy's allocators, but exactly.
+    """
+
+    def __init__(self, traced=False, interval=RSS_SAMPLE_INTERVAL):
+        self.traced = traced
+        self.interval = interval
+        self.windows = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.sampler = None
+        self.closed = False
+        # Highest Python allocations seen by any measure, whether or not a stage was open
+        self.traced_peak = 0
+        if traced and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _fold(self):
+        """Raise the peaks of the open windows to the current measures, lock held"""
+        rss = current_rss()
+        traced_peak = tracemalloc.get_traced_memory()[1] if self.traced else 0
+        self.traced_peak = max(self.traced_peak, traced_peak)
+        for window in self.windows:
+            window['peak_rss'] = max(window['peak_rss'], rss)
+            window['peak_traced'] = max(window['peak_traced'], traced_peak)
+        if self.traced:
+            # The next peak is measured from here, the previous one is kept in the windows
+            tracemalloc.reset_peak()
+
+    def _sample(self):
+        with self.lock:
+            while True:
+                while not self.windows and not self.closed:
+                    self.wakeup.wait()
+                if self.closed:
+                    return
+                self._fold()
+                self.wakeup.wait(self.interval)
+
+    def start(self):
+        """Open a measure window, returned to be passed to stop"""
+        with self.lock:
+            self._fold()
+            window = {
+                'peak_rss': current_rss(),
+                'traced_start': tracemalloc.get_traced_memory()[0] if self.traced else 0,
+                'peak_traced': 0,
+            }
+            self.windows.append(window)
+            if not self.closed and (self.sampler is None or not self.sampler.is_alive()):
+                self.sampler = threading.Thread(target=self._sample, name='chess-memory', daemon=True)
+                self.sampler.start()
+            self.wakeup.notify()
+        return window
+
+    def stop(self, window):
+        """Close a window, returning its peak RSS and its peak Python allocations above its start in bytes"""
+        with self.lock:
+            self._fold()
+            self.windows.remove(window)
+        peaks = {'peak_rss': window['peak_rss']}
+        if self.traced:
+            peaks['peak_traced'] = max(0, window['peak_traced'] - window['traced_start'])
+        return peaks
+
+    def close(self):
+        """Stop the sampler thread; windows still open can be stopped, without sampling"""
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify()
+
+
+def create_tracker(tracking=TRACKING):
+    """PeakTracker for the tracking mode, or None when memory is not tracked"""
+    if tracking in ('rss', 'all'):
+        return PeakTracker(traced=tracking == 'all')
+    return None
+
+
+class IdleUnloader:
+    """Call unload once nothing has used the models for timeout seconds
+
+    Unloading holds the lock, so it never overlaps a use; the next use reloads the models.
+    """
+
+    def __init__(self, timeout, unload, loaded=False):
+        self.timeout = timeout
+        self.unload = unload
+        self.lock = threading.Lock()
+        self.active = 0
+        self.loaded = loaded
+        self.last_used = time.monotonic()
+        self.timer = None
+        # Process the pending timer runs in: a timer inherited by a forked worker never fires
+        self.scheduled_pid = None
+        if loaded:
+            self.schedule(timeout)
+
+    @contextmanager
+    def use(self, load):
+        with self.lock:
+            if not self.loaded:
+                load()
+                self.loaded = True
+            # Counted once loaded, so that a failed load does not keep the models from ever unloading
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.last_used = time.monotonic()
+                if self.scheduled_pid != os.getpid():
+                    self.schedule(self.timeout)
+
+    def schedule(self, delay):
+        """Start the timer, lock held"""
+        self.scheduled_pid = os.getpid()
+        self.timer = threading.Timer(delay, self.expire)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def expire(self):
+        with self.lock:
+            # From here the end of the next use schedules a new timer
+            self.scheduled_pid = None
+            if self.active or not self.loaded:
+                return
+            remaining = self.last_used + self.timeout - time.monotonic()
+            if remaining > 0:
+                self.schedule(remaining)
+                return
+            self.unload()
+            self.loaded = False
+        release_memory()
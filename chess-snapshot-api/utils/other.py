@@ -92,6 +92,29 @@ def bound_corners(points, image_width, image_height):
 
     return points
 
+def overlap_ratio(box1, box2):
+    """Area of the intersection of two boxes over the area of the smaller one"""
+    width = min(box1[2], box2[2]) - max(box1[0], box2[0])
+    height = min(box1[3], box2[3]) - max(box1[1], box2[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller = min((box1[2] - box1[0]) * (box1[3] - box1[1]), (box2[2] - box2[0]) * (box2[3] - box2[1]))
+    return width * height / max(smaller, 1)
+
+def reading_order(boxes):
+    """Boxes sorted in rows from top to bottom, and from left to right within a row
+
+    A box belongs to the current row when its vertical center lies within the span of the row's first box.
+    """
+    rows = []
+    for box in sorted(boxes, key=lambda box: (box[1] + box[3]) / 2):
+        center = (box[1] + box[3]) / 2
+        if rows and rows[-1][0][1] <= center <= rows[-1][0][3]:
+            rows[-1].append(box)
+        else:
+            rows.append([box])
+    return [box for row in rows for box in sorted(row, key=lambda box: box[0])]
+
 def perspective_transform(image, corner_points):
     """Perform perspective transform"""
     width, height = corner_points[3][0] - corner_points[0][0], corner_points[1][1] - corner_points[0][1]
@@ -112,4 +135,26 @@ def point_transform(point, transform_matrices):
     for transform_matrix in transform_matrices:
         transformed_point = cv.perspectiveTransform(transformed_point, transform_matrix)
 
-    return transformed_point[0][0]
\ No newline at end of file
+    return transformed_point[0][0]
+
+def split_squares(image, padding=0.0):
+    """Split a rectified board image into 64 square crops, row by row from the top left"""
+    height, width = image.shape[:2]
+    square_width = width / 8
+    square_height = height / 8
+    pad_x = int(round(square_width * padding))
+    pad_y = int(round(square_height * padding))
+
+    if pad_x > 0 or pad_y > 0:
+        image = cv.copyMakeBorder(image, pad_y, pad_y, pad_x, pad_x, cv.BORDER_REPLICATE)
+
+    squares = []
+    for row in range(8):
+        for col in range(8):
+            x1 = int(round(col * square_width))
+            x2 = int(round((col + 1) * square_width)) + 2 * pad_x
+            y1 = int(round(row * square_height))
+            y2 = int(round((row + 1) * square_height)) + 2 * pad_y
+            squares.append(image[y1:y2, x1:x2])
+
+    return squares
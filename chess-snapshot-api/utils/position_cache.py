@@ -0,0 +1,209 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import cv2 as cv
+import numpy as np
+
+
+def content_hash(image_bytes):
+    """Exact key of an upload"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def perceptual_hash(image, hash_size=16):
+    """256-bit difference hash, stable across re-encoding, rescaling and small edits"""
+    if len(image.shape) == 3:
+        image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    small = cv.resize(image, (hash_size + 1, hash_size), interpolation=cv.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def thumbnail(image, size=64):
+    """Small grayscale copy of an image, kept to confirm perceptual hash matches"""
+    if len(image.shape) == 3:
+        image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    return cv.resize(image, (size, size), interpolation=cv.INTER_AREA)
+
+def local_difference(thumbnail_a, thumbnail_b, window=3):
+    """Largest mean difference between two thumbnails over any window x window area
+
+    A moved piece changes a few neighbouring pixels a lot, which a hash over the
+    whole image can miss, while re-encoding changes every pixel a little.
+    """
+    difference = cv.absdiff(thumbnail_a, thumbnail_b).astype(np.float32)
+    return float(cv.blur(difference, (window, window), borderType=cv.BORDER_REPLICATE).max())
+
+
+class PositionCache:
+    """LRU cache of detected positions keyed by upload content hash and optionally by perceptual hash
+
+    Entries can be persisted to a SQLite file so that they survive restarts and
+    are shared by the processes of one node, each with its own connection: one
+    opened before a fork is never used by the child. Perceptual hashes are indexed by
+    bands: a hash within max_distance bits of another one has at least one of
+    its max_distance + 1 bands equal to it, so only the entries sharing a band
+    are compared, and a match is only returned when the thumbnails of both
+    images also agree everywhere.
+    """
+    MAX_ENTRIES = 10000
+    # Out of 256 bits, candidates are then checked against their thumbnail
+    MAX_DISTANCE = 2
+    HASH_BITS = 256
+    # Gray levels: moving a piece changes a 64 px thumbnail by 30 or more, re-encoding and rescaling by 15 at most,
+    # while at 32 px a pawn moving between light squares stays under 10
+    MAX_LOCAL_DIFFERENCE = 20
+    THUMBNAIL_SIZE = 64
+
+    def __init__(self, max_entries=MAX_ENTRIES, path=None, perceptual=False, max_distance=MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'exact_hits': 0, 'perceptual_hits': 0, 'misses': 0, 'evictions': 0}
+
+        bands = max_distance + 1
+        self.band_bounds = [(self.HASH_BITS * i // bands, self.HASH_BITS * (i + 1) // bands) for i in range(bands)]
+        self.bands = [{} for _ in range(bands)]
+
+        self.path = path
+        self.connection = None
+        self.connection_pid = None
+        # Connections inherited through fork: closing them in the child could checkpoint
+        # and delete the WAL file the parent still uses, so they are only kept referenced
+        self.inherited_connections = []
+        if path:
+            self.load()
+
+    @property
+    def db(self):
+        """SQLite connection of the current process, opened on first use, or None without a path"""
+        if not self.path:
+            return None
+        if self.connection_pid != os.getpid():
+            if self.connection is not None:
+                self.inherited_connections.append(self.connection)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS position_entries '
+                                    '(key TEXT PRIMARY KEY, phash BLOB, thumbnail BLOB, fen TEXT, confidence REAL, '
+                                    'last_used REAL)')
+            self.connection.commit()
+            self.connection_pid = os.getpid()
+        return self.connection
+
+    def close(self):
+        """Close the connection of this process, before forking workers for instance"""
+        with self.lock:
+            if self.connection is not None and self.connection_pid == os.getpid():
+                self.connection.close()
+            self.connection = None
+            self.connection_pid = None
+
+    def load(self):
+        """Load the most recently used persisted entries"""
+        rows = self.db.execute('SELECT key, phash, thumbnail, fen, confidence FROM position_entries '
+                               'ORDER BY last_used DESC LIMIT ?', (self.max_entries,)).fetchall()
+        size = self.THUMBNAIL_SIZE
+        for key, phash, small, fen, confidence in reversed(rows):
+            phash = self.from_blob(phash)
+            if phash is None or small is None or len(small) != size * size:
+                phash, small = None, None
+            else:
+                small = np.frombuffer(small, dtype=np.uint8).reshape(size, size)
+            self.add(key, {'phash': phash, 'thumbnail': small, 'fen': fen, 'confidence': confidence})
+
+    def to_blob(self, phash):
+        """SQLite integers are 64-bit, hashes are stored as big-endian bytes"""
+        if phash is None:
+            return None
+        return phash.to_bytes(self.HASH_BITS // 8, 'big')
+
+    def from_blob(self, phash):
+        if not isinstance(phash, bytes) or len(phash) != self.HASH_BITS // 8:
+            return None
+        return int.from_bytes(phash, 'big')
+
+    def band_keys(self, phash):
+        return [(phash >> start) & ((1 << (end - start)) - 1) for start, end in self.band_bounds]
+
+    def add(self, key, entry):
+        """Insert or replace an entry and index its perceptual hash, lock held"""
+        self.remove(key)
+        self.entries[key] = entry
+        if entry['phash'] is not None:
+            for band, band_key in zip(self.bands, self.band_keys(entry['phash'])):
+                band.setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        """Remove an entry and its perceptual hash from the index, lock held"""
+        entry = self.entries.pop(key, None)
+        if entry is None or entry['phash'] is None:
+            return
+        for band, band_key in zip(self.bands, self.band_keys(entry['phash'])):
+            keys = band.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del band[band_key]
+
+    def get(self, key):
+        """Entry stored under an exact content hash, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            self.stats['exact_hits'] += 1
+            return entry
+
+    def get_similar(self, image):
+        """Entry whose perceptual hash is within max_distance bits of the image's, or None
+
+        Counts a miss when nothing matches, so call it after get() missed.
+        """
+        phash = perceptual_hash(image) if self.perceptual else None
+        with self.lock:
+            if phash is not None:
+                candidates = set()
+                for band, band_key in zip(self.bands, self.band_keys(phash)):
+                    candidates.update(band.get(band_key, ()))
+                distances = [((self.entries[key]['phash'] ^ phash).bit_count(), key) for key in candidates]
+                matches = sorted(match for match in distances if match[0] <= self.max_distance)
+                small = thumbnail(image, self.THUMBNAIL_SIZE) if matches else None
+                for _, key in matches:
+                    if local_difference(self.entries[key]['thumbnail'], small) <= self.MAX_LOCAL_DIFFERENCE:
+                        self.entries.move_to_end(key)
+                        self.stats['perceptual_hits'] += 1
+                        return self.entries[key]
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, image, fen, confidence):
+        """Store a detected position under the upload hash"""
+        phash = perceptual_hash(image) if self.perceptual else None
+        small = thumbnail(image, self.THUMBNAIL_SIZE) if self.perceptual else None
+        entry = {'phash': phash, 'thumbnail': small, 'fen': fen, 'confidence': confidence}
+        with self.lock:
+            self.add(key, entry)
+            evicted = []
+            while len(self.entries) > self.max_entries:
+                evicted.append(next(iter(self.entries)))
+                self.remove(evicted[-1])
+                self.stats['evictions'] += 1
+
+            db = self.db
+            if db is not None:
+                db.execute('INSERT OR REPLACE INTO position_entries VALUES (?, ?, ?, ?, ?, ?)',
+                           (key, self.to_blob(phash), small.tobytes() if small is not None else None, fen,
+                            confidence, time.time()))
+                db.executemany('DELETE FROM position_entries WHERE key = ?', [(k,) for k in evicted])
+                db.commit()
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, 'entries': len(self.entries), 'max_entries': self.max_entries}
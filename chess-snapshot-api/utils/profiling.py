@@ -0,0 +1,105 @@
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Profiling is only possible when profiles have somewhere to go
+PROFILE_DIR = os.environ.get('CHESS_PROFILE_DIR')
+# Share of the detections profiled without being asked, 0.01 profiles one in a hundred
+SAMPLE_RATE = float(os.environ.get('CHESS_PROFILE_SAMPLE_RATE', '0'))
+HEADER = 'X-Chess-Profile'
+
+_NULL_PROFILE = nullcontext()
+_current_session = contextvars.ContextVar('chess_profile', default=None)
+
+
+class ProfileSession:
+    """cProfile profilers of one detection, one per thread that took part in it"""
+
+    def __init__(self):
+        self.profilers = {}
+        self.lock = threading.Lock()
+
+    def start_thread(self):
+        """Start profiling the calling thread, returning its profiler or None if it is already profiled"""
+        thread_id = threading.get_ident()
+        with self.lock:
+            if thread_id in self.profilers:
+                return None
+            profiler = self.profilers[thread_id] = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stats(self):
+        """Profiles of every thread merged into one pstats.Stats"""
+        with self.lock:
+            profilers = list(self.profilers.values())
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        return stats
+
+    def dump(self, image_key, timings, trace=None, directory=None):
+        """Write <time>-<image hash>.prof, loadable with pstats, snakeviz or flameprof, and a .json
+        of the same name with the stage timings; returns the path of the .prof file"""
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        now = time.time()
+        name = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now % 1 * 1000):03d}-{image_key[:16]}"
+        path = os.path.join(directory, name + '.prof')
+        self.stats().dump_stats(path)
+        with open(os.path.join(directory, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump({'image': image_key, 'timings': timings, 'trace': trace, 'threads': len(self.profilers)}, f,
+                      indent=2)
+        return path
+
+
+def should_profile(requested=False):
+    """Profile a detection when the request asks for it or at random for SAMPLE_RATE of them,
+    as long as PROFILE_DIR is set"""
+    if not PROFILE_DIR:
+        return False
+    return requested or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)
+
+def is_requested(headers, args):
+    """Whether a request asks to be profiled, with the X-Chess-Profile: 1 header or ?profile=1"""
+    return headers.get(HEADER) == '1' or args.get('profile') == '1'
+
+@contextmanager
+def _profile_thread(session):
+    profiler = session.start_thread()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+def thread_profile():
+    """Context manager profiling the calling thread for the current session, doing nothing outside of one
+
+    Work submitted to other threads joins the session if it runs in a copy of the
+    current context (contextvars.copy_context().run).
+    """
+    session = _current_session.get()
+    if session is None:
+        return _NULL_PROFILE
+    return _profile_thread(session)
+
+@contextmanager
+def profile(enabled=True):
+    """Profile the enclosed detection in a ProfileSession, or yield None when not enabled"""
+    if not enabled:
+        yield None
+        return
+    session = ProfileSession()
+    token = _current_session.set(session)
+    try:
+        with _profile_thread(session):
+            yield session
+    finally:
+        _current_session.reset(token)
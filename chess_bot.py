@@ -11,6 +11,7 @@ from typing import Optional, Tuple
 import cv2  # type: ignore
 import numpy as np  # type: ignore
 from gpu_config import GPUConfig
+from thread_budget import ThreadBudget
 
 try:
     import pyautogui  # type: ignore
@@ -188,7 +189,7 @@ def call_local_stockfish(fen: str) -> Optional[str]:
     
     try:
         sf = Stockfish(STOCKFISH_PATH, parameters={
-            "Threads": os.cpu_count() or 4,
+            "Threads": ThreadBudget().engine_threads,
             "Hash": 512,
             "Minimum Thinking Time": 100,
             "Skill Level": 15,
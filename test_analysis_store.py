@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'chess-snapshot-api'))
+from analysis.analysis_store import AnalysisStore, normalize_fen
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+E4_FEN = 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1'
+
+
+def analysis(depth, best_move='e2e4'):
+    return {'depth': depth, 'score': {'cp': 30}, 'best_move': best_move, 'pv': [best_move]}
+
+
+def test_normalize_fen():
+    # Move counters and an en passant square without a capturing pawn are ignored
+    assert normalize_fen(START_FEN) == normalize_fen(START_FEN.replace(' 0 1', ' 4 12'))
+    assert normalize_fen(E4_FEN) == normalize_fen(E4_FEN.replace(' e3 ', ' - '))
+
+
+def test_depth():
+    store = AnalysisStore()
+    store.put(START_FEN, analysis(12))
+    assert store.get(START_FEN, 10)['depth'] == 12
+    assert store.get(START_FEN, 12)['depth'] == 12
+    assert store.get(START_FEN, 15) is None
+
+    # A shallower analysis never replaces a deeper one
+    store.put(START_FEN, analysis(8, 'd2d4'))
+    assert store.get(START_FEN, 12)['best_move'] == 'e2e4'
+    store.put(START_FEN, analysis(16, 'd2d4'))
+    assert store.get(START_FEN, 15)['best_move'] == 'd2d4'
+
+
+def test_lru_eviction():
+    store = AnalysisStore(max_entries=1)
+    store.put(START_FEN, analysis(10))
+    store.put(E4_FEN, analysis(10, 'e7e5'))
+    assert store.get(START_FEN, 10) is None
+    assert store.get(E4_FEN, 10)['best_move'] == 'e7e5'
+    assert store.get_stats()['entries'] == 1
+
+
+def test_persistence():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'analyses.sqlite')
+        store = AnalysisStore(max_entries=1, path=path)
+        store.put(START_FEN, analysis(12))
+        store.put(E4_FEN, analysis(10, 'e7e5'))
+        store.put(START_FEN, analysis(8, 'd2d4'))
+
+        # Evicted from memory, the deeper analysis is read back from disk
+        store.entries.clear()
+        assert store.get(START_FEN, 12)['best_move'] == 'e2e4'
+        assert store.get(E4_FEN, 10)['best_move'] == 'e7e5'
+        store.close()
+
+        store = AnalysisStore(path=path)
+        assert store.get(START_FEN, 12)['best_move'] == 'e2e4'
+        assert store.get_stats()['disk_hits'] == 1
+        store.close()
+
+
+if __name__ == "__main__":
+    test_normalize_fen()
+    test_depth()
+    test_lru_eviction()
+    test_persistence()
@@ -0,0 +1,66 @@
+import os
+import struct
+import sys
+import tempfile
+
+import chess
+import chess.polyglot
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'chess-snapshot-api'))
+from analysis.fast_path import FastPath
+
+
+def polyglot_move(move):
+    return chess.square_file(move.to_square) | chess.square_rank(move.to_square) << 3 | \
+        chess.square_file(move.from_square) << 6 | chess.square_rank(move.from_square) << 9
+
+def write_book(path, entries):
+    """Polyglot book of (board, uci move, weight) entries, sorted by position key"""
+    records = sorted((chess.polyglot.zobrist_hash(board), polyglot_move(chess.Move.from_uci(move)), weight)
+                     for board, move, weight in entries)
+    with open(path, 'wb') as f:
+        for key, move, weight in records:
+            f.write(struct.pack('>QHHI', key, move, weight, 0))
+
+
+def test_book():
+    start = chess.Board()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'book.bin')
+        write_book(path, [(start, 'e2e4', 10), (start, 'd2d4', 30), (start, 'g1f3', 5)])
+        fast_path = FastPath(book_path=path)
+        try:
+            analysis = fast_path.probe(start.fen())
+            assert analysis['source'] == 'book'
+            assert analysis['best_move'] == 'd2d4'
+            assert analysis['depth'] is None
+            assert {entry['move'] for entry in analysis['book_moves']} == {'e2e4', 'd2d4', 'g1f3'}
+
+            start.push_uci('e2e4')
+            assert fast_path.probe(start.fen()) is None
+            assert fast_path.get_stats()['book_hits'] == 1
+            assert fast_path.get_stats()['misses'] == 1
+        finally:
+            fast_path.close()
+
+
+def test_without_tables():
+    fast_path = FastPath()
+    assert fast_path.probe('8/8/8/8/8/8/4k3/4K2Q w - - 0 1') is None
+    assert fast_path.get_stats()['misses'] == 1
+
+
+def test_tablebase_without_table_files():
+    with tempfile.TemporaryDirectory() as directory:
+        # No table file: no position can be probed
+        fast_path = FastPath(tablebase_path=directory)
+        assert fast_path.max_pieces == 0
+        assert fast_path.probe_tablebase(chess.Board('4k3/8/8/8/8/8/8/4K2R w K - 0 1')) is None
+        assert fast_path.probe_tablebase(chess.Board()) is None
+        fast_path.close()
+
+
+if __name__ == "__main__":
+    test_book()
+    test_without_tables()
+    test_tablebase_without_table_files()
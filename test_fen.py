@@ -0,0 +1,70 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'chess-snapshot-api'))
+from utils.fen import EMPTY_SQUARE, PIECE_CLASSES, assign_squares, board_to_fen, fen_to_board
+
+
+def scores(**piece_scores):
+    """Score array ordered as PIECE_CLASSES from piece letter keywords, 0 for the others"""
+    array = np.zeros(len(PIECE_CLASSES))
+    for piece, score in piece_scores.items():
+        array[PIECE_CLASSES.index(piece)] = score
+    return array
+
+
+def test_fen_round_trip():
+    fen = 'rnbqkbnr/pp1ppppp/8/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R'
+    assert board_to_fen(fen_to_board(fen)) == fen
+
+
+def test_assign_squares_best_class():
+    chessboard = assign_squares({(4, 4): scores(P=0.9, B=0.2), (0, 4): scores(k=0.8)})
+    assert chessboard[4][4] == 'P'
+    assert chessboard[0][4] == 'k'
+    assert chessboard[3][3] == EMPTY_SQUARE
+
+
+def test_assign_squares_no_pawn_on_first_or_last_rank():
+    chessboard = assign_squares({(0, 0): scores(p=0.9, r=0.4), (7, 3): scores(P=0.95, B=0.3)})
+    assert chessboard[0][0] == 'r'
+    assert chessboard[7][3] == 'B'
+
+
+def test_assign_squares_pawn_only_evidence_on_last_rank_is_empty():
+    chessboard = assign_squares({(7, 3): scores(P=0.95)})
+    assert chessboard[7][3] == EMPTY_SQUARE
+
+
+def test_assign_squares_piece_slots():
+    # Two white kings: the least likely one falls back to its next best class
+    chessboard = assign_squares({(7, 4): scores(K=0.9, Q=0.1), (7, 6): scores(K=0.6, Q=0.5)})
+    assert chessboard[7][4] == 'K'
+    assert chessboard[7][6] == 'Q'
+
+    # Three white knights: only two slots, the third square stays empty without another class
+    squares = {(5, col): scores(N=0.5 + col / 10) for col in range(3)}
+    chessboard = assign_squares(squares)
+    assert [chessboard[5][col] for col in range(3)] == [EMPTY_SQUARE, 'N', 'N']
+
+
+def test_assign_squares_empty_scores():
+    chessboard = assign_squares({(3, 3): scores(n=0.4), (3, 4): scores(n=0.4)}, {(3, 3): 0.9})
+    assert chessboard[3][3] == EMPTY_SQUARE
+    assert chessboard[3][4] == 'n'
+
+
+def test_assign_squares_without_scores():
+    assert assign_squares({}) == [[EMPTY_SQUARE] * 8 for _ in range(8)]
+
+
+if __name__ == "__main__":
+    test_fen_round_trip()
+    test_assign_squares_best_class()
+    test_assign_squares_no_pawn_on_first_or_last_rank()
+    test_assign_squares_pawn_only_evidence_on_last_rank_is_empty()
+    test_assign_squares_piece_slots()
+    test_assign_squares_empty_scores()
+    test_assign_squares_without_scores()
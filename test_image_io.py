@@ -0,0 +1,59 @@
+import os
+import struct
+import sys
+
+import cv2 as cv
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'chess-snapshot-api'))
+from utils.image_io import decode_image, read_image_size, reduced_decode_mode
+from utils.other import resize_image
+
+TARGET_SIZE = 700
+# Sizes around the decode factor boundaries, where the smaller side is 700 times 1, 2, 4 or 8
+BOUNDARY_SIZES = [
+    (2800, 1400), (2802, 1402), (2804, 1404), (1400, 2800), (1402, 1402),
+    (1400, 700), (1402, 701), (5600, 2800), (5608, 2808), (700, 700), (701, 701),
+]
+
+
+def encode(width, height, extension):
+    image = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv.imencode(extension, image)[1].tobytes()
+
+
+def test_read_image_size():
+    for extension in ('.jpg', '.png', '.bmp'):
+        assert read_image_size(encode(321, 123, extension)) == (321, 123)
+    assert read_image_size(b'GIF89a' + struct.pack('<HH', 640, 480)) == (640, 480)
+    assert read_image_size(b'not an image') is None
+
+
+def test_read_jpeg_size_markers():
+    # Progressive JPEG: the size is in an SOF2 segment
+    image = np.random.default_rng(0).integers(0, 256, (90, 160, 3), dtype=np.uint8)
+    progressive = cv.imencode('.jpg', image, [cv.IMWRITE_JPEG_PROGRESSIVE, 1])[1].tobytes()
+    assert read_image_size(progressive) == (160, 90)
+    # Header cut before the start-of-frame segment
+    assert read_image_size(progressive[:20]) is None
+
+
+def test_reduced_decode_mode():
+    assert reduced_decode_mode(2800, 1400, TARGET_SIZE) == cv.IMREAD_COLOR
+    assert reduced_decode_mode(2802, 1402, TARGET_SIZE) == cv.IMREAD_REDUCED_COLOR_2
+    assert reduced_decode_mode(5608, 2808, TARGET_SIZE) == cv.IMREAD_REDUCED_COLOR_4
+    assert reduced_decode_mode(700, 700, TARGET_SIZE) == cv.IMREAD_COLOR
+
+
+def test_decode_image_resizes_like_full_decode():
+    for width, height in BOUNDARY_SIZES:
+        image_bytes = encode(width, height, '.jpg')
+        expected = resize_image(decode_image(image_bytes), TARGET_SIZE).shape
+        assert resize_image(decode_image(image_bytes, TARGET_SIZE), TARGET_SIZE).shape == expected, (width, height)
+
+
+if __name__ == "__main__":
+    test_read_image_size()
+    test_read_jpeg_size_markers()
+    test_reduced_decode_mode()
+    test_decode_image_resizes_like_full_decode()
@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+
+import cv2 as cv
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'chess-snapshot-api'))
+from utils.board_renderer import PieceSprites, render_board
+from utils.position_cache import PositionCache, perceptual_hash
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR'
+E4_FEN = 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR'
+
+
+def board_image(fen):
+    return render_board(fen, PieceSprites(), square_size=48)
+
+
+def test_lru_eviction():
+    cache = PositionCache(max_entries=2)
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    cache.put('a', image, 'fen a', 0.9)
+    cache.put('b', image, 'fen b', 0.9)
+    assert cache.get('a')['fen'] == 'fen a'
+    cache.put('c', image, 'fen c', 0.9)
+
+    # b was the least recently used entry once a was read
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_band_lookup():
+    cache = PositionCache(perceptual=True)
+    image = board_image(START_FEN)
+    cache.put('start', image, START_FEN, 0.9)
+
+    phash = perceptual_hash(image)
+    # Hashes within max_distance bits share at least one band
+    for bits in ((0,), (5,), (3, 200)):
+        near = phash
+        for bit in bits:
+            near ^= 1 << bit
+        keys = set()
+        for band, band_key in zip(cache.bands, cache.band_keys(near)):
+            keys.update(band.get(band_key, ()))
+        assert keys == {'start'}
+
+    # A re-encoded and rescaled copy matches, a board one move away does not
+    _, encoded = cv.imencode('.jpg', cv.resize(image, (300, 300)), [cv.IMWRITE_JPEG_QUALITY, 80])
+    assert cache.get_similar(cv.imdecode(encoded, cv.IMREAD_COLOR))['fen'] == START_FEN
+    assert cache.get_similar(board_image(E4_FEN)) is None
+
+
+def test_eviction_removes_band_index():
+    cache = PositionCache(max_entries=1, perceptual=True)
+    cache.put('start', board_image(START_FEN), START_FEN, 0.9)
+    cache.put('e4', board_image(E4_FEN), E4_FEN, 0.9)
+    assert all('start' not in keys for band in cache.bands for keys in band.values())
+    assert cache.get_similar(board_image(START_FEN)) is None
+
+
+def test_persistence():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite')
+        cache = PositionCache(path=path, perceptual=True)
+        cache.put('start', board_image(START_FEN), START_FEN, 0.9)
+        cache.close()
+
+        cache = PositionCache(path=path, perceptual=True)
+        assert cache.get('start')['fen'] == START_FEN
+        assert cache.get_similar(board_image(START_FEN))['fen'] == START_FEN
+        cache.close()
+
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_band_lookup()
+    test_eviction_removes_band_index()
+    test_persistence()
@@ -0,0 +1,86 @@
+import os
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ThreadBudget:
+    """Per-process thread budget shared by OpenCV, TensorFlow, PyTorch and the chess engine
+
+    Each library sizes its own thread pool to every core by default, so several
+    worker processes on one node oversubscribe the CPUs. The budget defaults to
+    the available CPUs divided by the number of worker processes, which can be
+    set with CHESS_WORKERS, or is given directly with CHESS_THREADS.
+    """
+    # Budget last applied in this process, which also sizes the detector's own thread pool
+    applied = None
+
+    def __init__(self, threads=None, workers=None):
+        self.cpus = available_cpus()
+        self.workers = workers or int(os.environ.get('CHESS_WORKERS', 1))
+        threads = threads or int(os.environ.get('CHESS_THREADS', 0))
+        self.threads = threads or max(1, len(self.cpus) // self.workers)
+
+    @property
+    def engine_threads(self):
+        """Value for the UCI Threads option of the chess engine"""
+        return self.threads
+
+    def worker_cpus(self, worker_index):
+        """Slice of the available CPUs reserved for one worker process"""
+        start = (worker_index * self.threads) % len(self.cpus)
+        return [self.cpus[(start + i) % len(self.cpus)] for i in range(min(self.threads, len(self.cpus)))]
+
+    def configure_environment(self):
+        """Limit the OpenMP/BLAS pools of libraries and child processes not loaded yet"""
+        for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+            os.environ[variable] = str(self.threads)
+
+    def configure_opencv(self):
+        """Size the OpenCV thread pool"""
+        import cv2
+        cv2.setNumThreads(self.threads)
+
+    def configure_tensorflow(self):
+        """Size the TensorFlow thread pools, which is only possible before TensorFlow runs anything"""
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(self.threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+            return True
+        except RuntimeError as e:
+            print(f"⚠️ Threads TensorFlow déjà initialisés: {e}")
+            return False
+
+    def configure_torch(self):
+        """Size the PyTorch thread pools"""
+        import torch
+        torch.set_num_threads(self.threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only possible once, before any inter-op parallel work
+            pass
+
+    def set_affinity(self, worker_index):
+        """Pin the current process to the CPUs of one worker"""
+        if not hasattr(os, 'sched_setaffinity'):
+            print("⚠️ Affinité CPU non supportée sur ce système")
+            return False
+        os.sched_setaffinity(0, self.worker_cpus(worker_index))
+        return True
+
+    def apply(self, worker_index=None):
+        """Apply the budget to every library, optionally pinning the process to its CPUs"""
+        self.configure_environment()
+        self.configure_opencv()
+        self.configure_torch()
+        self.configure_tensorflow()
+        if worker_index is not None:
+            self.set_affinity(worker_index)
+        ThreadBudget.applied = self
+        print(f"🧵 Budget de {self.threads} thread(s) par processus ({self.workers} worker(s), {len(self.cpus)} CPU)")